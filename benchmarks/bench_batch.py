@@ -0,0 +1,43 @@
+"""Batch rendering benchmark: thumbnails per second of render_batch
+
+Run with ``python benchmarks/bench_batch.py``, the workers use the
+offscreen platform.  Each thumbnail is a random tree of about 2k nodes,
+built in the worker from its seed.
+"""
+import argparse
+import random
+import tempfile
+from pathlib import Path
+
+from qsquaremap.export import render_batch
+from trees import build_tree
+
+
+def load_seed(seed):
+    """Loader of the jobs: the model of a thumbnail from its seed"""
+    return build_tree(12, 4, random.Random(seed), random_fanout=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=200, help='number of thumbnails')
+    parser.add_argument('--size', type=int, default=256, help='thumbnail width and height')
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 2, 4],
+        help='worker process counts to measure',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in args.workers:
+            jobs = [
+                (seed, Path(directory) / ('%d.png' % seed)) for seed in range(args.count)
+            ]
+            report = render_batch(
+                jobs, args.size, args.size, loader=load_seed, workers=workers,
+            )
+            print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Layout benchmark: a single node with a huge number of children
+
+Run with ``QT_QPA_PLATFORM=offscreen python benchmarks/bench_fanout.py``.
+"""
+import argparse
+import random
+import time
+
+from qtpy import QtCore
+
+from qsquaremap import DefaultAdapter, LayoutEngine, Node
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--children', type=int, default=500000)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--square-style', action='store_true')
+    parser.add_argument(
+        '--vectorize', type=int, metavar='THRESHOLD',
+        help='lay out more children than THRESHOLD with the NumPy kernel',
+    )
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    children = [Node('file%d' % i, rnd.randint(1, 1 << 20), ()) for i in range(args.children)]
+    model = Node('dir', sum([child.value for child in children]), children)
+    engine = LayoutEngine(DefaultAdapter(), square_style=args.square_style)
+    engine.vectorize_threshold = args.vectorize
+    start = time.perf_counter()
+    layout = engine.layout(model, QtCore.QRectF(0, 0, args.width, args.height))
+    print('%d children: %d boxes laid out in %.3fs' % (
+        args.children, len(layout.boxes_by_node), time.perf_counter() - start
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Hit-testing benchmark: positions looked up per second on a large map
+
+Run with ``QT_QPA_PLATFORM=offscreen python benchmarks/bench_hittest.py``.
+The default tree has 100 x 100 x 100 leaves, i.e. a map of about 1M boxes.
+"""
+import argparse
+import random
+import time
+
+from qtpy import QtCore
+
+from qsquaremap import DefaultAdapter, HotMapNavigator, LayoutEngine
+from timing import rate
+from trees import build_tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fanout', type=int, default=100)
+    parser.add_argument('--levels', type=int, default=3)
+    parser.add_argument('--size', type=int, default=4000, help='map width and height')
+    parser.add_argument('--queries', type=int, default=100000)
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    model = build_tree(args.fanout, args.levels, rnd)
+    engine = LayoutEngine(DefaultAdapter(), padding=0, margin=0)
+    start = time.perf_counter()
+    layout = engine.layout(model, QtCore.QRectF(0, 0, args.size, args.size))
+    print('layout: %d boxes in %.2fs' % (
+        len(layout.boxes_by_node), time.perf_counter() - start
+    ))
+
+    points = [
+        QtCore.QPointF(rnd.random() * args.size, rnd.random() * args.size)
+        for i in range(args.queries)
+    ]
+    print('indexed: %.0f hit-tests/s' % rate(layout.nodeAtPosition, points))
+    print('linear:  %.0f hit-tests/s' % rate(
+        lambda point: HotMapNavigator.findNodeAtPosition(layout.hot_map, point),
+        points[:max(1, args.queries // 100)],
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Painting benchmark: per-node versus batched drawing of a laid out map
+
+Run with ``QT_QPA_PLATFORM=offscreen python benchmarks/bench_paint.py``.
+The default tree has 47 x 47 x 47 leaves, i.e. about 100k nodes.
+"""
+import argparse
+import random
+import sys
+import time
+
+from qtpy import QtCore, QtGui, QtWidgets
+
+from qsquaremap import DefaultAdapter, LayoutEngine, LayoutRenderer
+from trees import build_tree
+
+
+def frame_time(renderer, layout, image, frames):
+    """Return the mean time to render the layout into the image"""
+    start = time.perf_counter()
+    for frame in range(frames):
+        image.fill(QtCore.Qt.GlobalColor.transparent)
+        painter = QtGui.QPainter(image)
+        renderer.render(painter, layout.boxes())
+        painter.end()
+    return (time.perf_counter() - start) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fanout', type=int, default=47)
+    parser.add_argument('--levels', type=int, default=3)
+    parser.add_argument('--size', type=int, default=4000, help='image width and height')
+    parser.add_argument('--frames', type=int, default=5)
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    adapter = DefaultAdapter()
+    model = build_tree(args.fanout, args.levels, random.Random(0))
+    layout = LayoutEngine(adapter, padding=1, margin=1).layout(
+        model, QtCore.QRectF(0, 0, args.size, args.size)
+    )
+    print('%d boxes' % len(layout.boxes_by_node))
+    image = QtGui.QImage(args.size, args.size, QtGui.QImage.Format.Format_ARGB32_Premultiplied)
+    for batched in (False, True):
+        renderer = LayoutRenderer(adapter, batched=batched)
+        print('%-8s %.1f ms/frame' % (
+            'batched' if batched else 'per-node',
+            frame_time(renderer, layout, image, args.frames) * 1000,
+        ))
+
+
+if __name__ == '__main__':
+    main()
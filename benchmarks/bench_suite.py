@@ -0,0 +1,169 @@
+"""Benchmark suite: layout, paint, hit-testing and memory on synthetic trees
+
+Run with ``QT_QPA_PLATFORM=offscreen python benchmarks/bench_suite.py``.
+Every tree shape and size is measured in a fresh process, so that its peak
+memory is its own.  Results are written as JSON; pass the file of an
+earlier run to --compare to print how each measure changed since.
+
+The tree shapes are described in trees.build_shape.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent import futures
+
+from timing import best_time, rate
+from trees import SHAPES, build_shape
+
+# the measures compared by --compare, and whether bigger is better
+MEASURES = (
+    ('layout_seconds', False),
+    ('paint_seconds', False),
+    ('paint_cached_seconds', False),
+    ('find_node_per_second', True),
+    ('node_at_position_per_second', True),
+    ('peak_memory', False),
+)
+
+
+def run_case(shape, count, width, height, padding, margin, repeat, queries):
+    """Measure one tree, in its own process (see main)"""
+    from qtpy import QtCore, QtGui
+
+    from qsquaremap import DefaultAdapter, HotMapNavigator, LayoutEngine, QSquareMap, Rect
+    from qsquaremap.export import ensure_application, peak_memory
+
+    app = ensure_application()
+    rnd = random.Random(0)
+    result = {'shape': shape, 'nodes': count, 'width': width, 'height': height}
+    start = time.perf_counter()
+    model = build_shape(shape, count, rnd)
+    result['build_seconds'] = time.perf_counter() - start
+    result['tree_memory'] = peak_memory()
+
+    engine = LayoutEngine(DefaultAdapter(), padding=padding, margin=margin)
+    rect = Rect(0, 0, width, height)
+    result['layout_seconds'] = best_time(lambda: engine.layout(model, rect), repeat)
+    layout = engine.layout(model, rect)
+    result['boxes'] = len(layout.boxes_by_node)
+    result['max_depth'] = layout.max_depth_seen
+
+    points = [(rnd.random() * width, rnd.random() * height) for i in range(queries)]
+    result['node_at_position_per_second'] = rate(layout.nodeAtPosition, points)
+    result['find_node_per_second'] = rate(
+        lambda point: HotMapNavigator.findNodeAtPosition(layout.hot_map, point),
+        points[:max(1, queries // 100)],
+    )
+
+    widget = QSquareMap(model=model, padding=padding, margin=margin)
+    widget.background_layout = False
+    widget.resize(width, height)
+    image = QtGui.QImage(width, height, QtGui.QImage.Format.Format_ARGB32_Premultiplied)
+
+    def paint(cold):
+        if cold:
+            # drops the layouts and the rendered map, as a new model would
+            widget.model = model
+        image.fill(QtCore.Qt.GlobalColor.transparent)
+        widget.render(image)
+
+    result['paint_seconds'] = best_time(lambda: paint(True), repeat)
+    result['paint_cached_seconds'] = best_time(lambda: paint(False), repeat)
+    result['peak_memory'] = peak_memory()
+    return result
+
+
+def git_commit():
+    """Return the commit of the working tree, None if unknown"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    """Print the change of each measure since the previous results
+
+    Ratios above 1 are improvements: faster, more hit-tests or less memory.
+    """
+    before = {(entry['shape'], entry['nodes']): entry for entry in previous['results']}
+    print('compared to %s' % (previous.get('commit') or 'the previous run',))
+    for entry in results:
+        old = before.get((entry['shape'], entry['nodes']))
+        if old is None:
+            continue
+        changes = []
+        for measure, bigger_is_better in MEASURES:
+            if entry.get(measure) and old.get(measure):
+                ratio = entry[measure] / old[measure]
+                if not bigger_is_better:
+                    ratio = 1 / ratio
+                changes.append('%s x%.2f' % (measure, ratio))
+        print('%-12s %8d  %s' % (entry['shape'], entry['nodes'], '  '.join(changes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES))
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+        help='node counts to measure',
+    )
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--padding', type=int, default=1)
+    parser.add_argument('--margin', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help='best of repeat runs')
+    parser.add_argument('--queries', type=int, default=100000, help='hit-tests per tree')
+    parser.add_argument('--output', default='bench_suite.json', help='JSON file to write')
+    parser.add_argument('--compare', help='JSON file of an earlier run')
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for shape in args.shapes:
+        for count in args.sizes:
+            with futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                result = pool.submit(
+                    run_case, shape, count, args.width, args.height,
+                    args.padding, args.margin, args.repeat, args.queries,
+                ).result()
+            results.append(result)
+            print(
+                '%-12s %8d nodes %7d boxes  layout %8.1f ms  paint %8.1f ms'
+                '  cached %6.1f ms  %9.0f hits/s  %7.1f MB' % (
+                    shape, count, result['boxes'],
+                    result['layout_seconds'] * 1000,
+                    result['paint_seconds'] * 1000,
+                    result['paint_cached_seconds'] * 1000,
+                    result['node_at_position_per_second'],
+                    (result['peak_memory'] or 0) / 1e6,
+                )
+            )
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'options': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print('results written to %s' % (args.output,))
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Tiled rendering benchmark: scaling of TiledRenderer with the number of threads
+
+Run with ``QT_QPA_PLATFORM=offscreen python benchmarks/bench_tiles.py``.
+The default map is an 8K (7680 x 4320) image of about 100k nodes.
+"""
+import argparse
+import random
+import sys
+import time
+
+from qtpy import QtCore, QtWidgets
+
+from qsquaremap import DefaultAdapter, LayoutEngine, TiledRenderer
+from trees import build_tree
+
+
+def frame_time(renderer, layout, frames):
+    """Return the mean time to render the layout into a QImage"""
+    start = time.perf_counter()
+    for frame in range(frames):
+        renderer.render(layout)
+    return (time.perf_counter() - start) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fanout', type=int, default=47)
+    parser.add_argument('--levels', type=int, default=3)
+    parser.add_argument('--width', type=int, default=7680)
+    parser.add_argument('--height', type=int, default=4320)
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--frames', type=int, default=3)
+    parser.add_argument(
+        '--threads', type=int, nargs='+', default=[1, 2, 4, 8],
+        help='thread counts to measure',
+    )
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    adapter = DefaultAdapter()
+    model = build_tree(args.fanout, args.levels, random.Random(0))
+    layout = LayoutEngine(adapter, padding=1, margin=1).layout(
+        model, QtCore.QRectF(0, 0, args.width, args.height)
+    )
+    print('%d boxes, %dx%d pixels, %d pixel tiles' % (
+        len(layout.boxes_by_node), args.width, args.height, args.tile_size,
+    ))
+    baseline = None
+    for threads in args.threads:
+        renderer = TiledRenderer(adapter, tile_size=args.tile_size, threads=threads)
+        elapsed = frame_time(renderer, layout, args.frames)
+        baseline = baseline or elapsed
+        print('%2d threads %8.1f ms/frame  x%.2f' % (
+            threads, elapsed * 1000, baseline / elapsed,
+        ))
+
+
+if __name__ == '__main__':
+    main()
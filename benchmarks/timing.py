@@ -0,0 +1,25 @@
+"""Timing helpers shared by the benchmarks
+
+Import it from a benchmark run as ``python benchmarks/<script>.py``, the
+benchmarks directory is then on the path.
+"""
+import time
+
+
+def best_time(function, repeat):
+    """Return the shortest of repeat timed calls of function"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def rate(find, points):
+    """Return the number of find calls per second over the points"""
+    start = time.perf_counter()
+    for point in points:
+        find(point)
+    return len(points) / (time.perf_counter() - start)
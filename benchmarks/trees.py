@@ -0,0 +1,63 @@
+"""Synthetic Node trees shared by the benchmarks
+
+Import it from a benchmark run as ``python benchmarks/<script>.py``, the
+benchmarks directory is then on the path.
+"""
+import math
+from collections import deque
+
+from qsquaremap import Node
+
+SHAPES = ('deep-narrow', 'shallow-wide', 'zipf')
+
+
+def build_tree(fanout, levels, rnd, random_fanout=False):
+    """Build a tree with fanout children per node and levels levels
+
+    random_fanout -- give each node between 1 and fanout children instead
+    """
+    if not levels:
+        return Node('leaf', rnd.randint(1, 1000), ())
+    count = rnd.randint(1, fanout) if random_fanout else fanout
+    children = [build_tree(fanout, levels - 1, rnd, random_fanout) for i in range(count)]
+    return Node('node', sum([child.value for child in children]), children)
+
+
+def build_breadth_first(count, fanout, leaf_value, rnd):
+    """Build a tree of count nodes breadth first, fanout(rnd) children per node"""
+    root = Node('n0', 0, [])
+    nodes, parents = [root], deque([root])
+    while len(nodes) < count:
+        parent = parents.popleft()
+        for i in range(min(fanout(rnd), count - len(nodes))):
+            child = Node('n%d' % len(nodes), 0, [])
+            parent.children.append(child)
+            nodes.append(child)
+            parents.append(child)
+    # children come after their parent, so the values are summed up in reverse
+    for node in reversed(nodes):
+        if node.children:
+            node.value = sum([child.value for child in node.children])
+        else:
+            node.value = leaf_value(rnd)
+    return root
+
+
+def build_shape(shape, count, rnd):
+    """Build the tree of one of SHAPES with count nodes
+
+    deep-narrow -- 2 children per node, about 20 levels deep at 1M nodes
+    shallow-wide -- sqrt(count) children per node, 2 levels deep
+    zipf -- 2 to 16 children per node, leaf sizes following Zipf's law
+    """
+    uniform = lambda rnd: rnd.randint(1, 1000)
+    if shape == 'deep-narrow':
+        return build_breadth_first(count, lambda rnd: 2, uniform, rnd)
+    if shape == 'shallow-wide':
+        fanout = max(2, int(math.ceil(math.sqrt(count))))
+        return build_breadth_first(count, lambda rnd: fanout, uniform, rnd)
+    if shape == 'zipf':
+        # the size of a random rank, out of count, for an exponent of 1.07
+        zipf = lambda rnd: count / rnd.randint(1, count) ** 1.07
+        return build_breadth_first(count, lambda rnd: rnd.randint(2, 16), zipf, rnd)
+    raise ValueError('Unknown tree shape %r' % (shape,))
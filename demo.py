@@ -13,6 +13,7 @@ from qtpy.QtGui import QIcon, QAction, QCursor
 from qtpy.QtCore import QSize, Qt
 
 from qsquaremap import Node, QSquareMap
+from qsquaremap.export import export_map
 
 class MainWindow(QMainWindow):
 
@@ -139,7 +140,22 @@ class MainWindow(QMainWindow):
 
     def write_file(self):
 
-        self.path.write_text(self.text_edit.toPlainText())
+        square_map = self.square_map
+        export_map(
+            square_map.rootNode(),
+            self.path,
+            square_map.width(),
+            square_map.height(),
+            adapter=square_map.adapter,
+            labels=square_map.labels,
+            padding=square_map.padding,
+            margin=square_map.margin,
+            square_style=square_map.square_style,
+            squarified=square_map.squarified,
+            min_area=square_map.min_area,
+            max_depth=square_map.max_depth,
+            ordered=square_map.ordered,
+        )
         self.statusBar().showMessage('The file has been saved...', 3000)
 
 
@@ -158,7 +174,6 @@ class MainWindow(QMainWindow):
 
         self.path = Path(filename)
         self.write_file()
-        self.set_title(filename)
 
 
     def open_dir(self):
@@ -1,3 +1,34 @@
-"""QSquareMap"""
-from .qsquaremap import *
-__ALL__ = DefaultAdapter, HotMapNavigator, Node, QSquareMap
+"""QSquareMap
+
+The layout core (qsquaremap.layout) imports without Qt, the widget and
+renderers are imported, with the Qt binding, on first access.
+"""
+import importlib
+
+from .arraytree import ArrayTree
+from .layout import (
+    AggregateNode,
+    Layout,
+    LayoutCache,
+    LayoutEngine,
+    Node,
+    NodeAdapter,
+    Rect,
+)
+from .spatial import RectIndex
+
+__all__ = [
+    'AggregateNode', 'ArrayAdapter', 'ArrayTree', 'CachingAdapter', 'DefaultAdapter',
+    'HotMapNavigator', 'Layout', 'LayoutCache', 'LayoutEngine', 'LayoutTask', 'Node',
+    'NodeAdapter', 'QSquareMap', 'Rect', 'RectIndex', 'TiledRenderer',
+]
+
+
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    widget = importlib.import_module(__name__ + '.qsquaremap')
+    try:
+        return getattr(widget, name)
+    except AttributeError:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name)) from None
@@ -0,0 +1,96 @@
+"""Compact, array backed tree model"""
+from array import array
+from collections import deque
+
+
+class ArrayTree:
+    """Columnar node tree for trees with millions of nodes
+
+    Nodes are integer indices numbered breadth first, the root is 0.  The
+    children of a node are the contiguous range
+    ``offsets[node]:offsets[node + 1]`` and the columns are:
+
+    offsets -- CSR child offsets, one more entry than there are nodes
+    parents -- index of the parent node, -1 for the root
+    values -- node values
+    label_ids -- index of the node label in labels
+    labels -- interned label table
+    """
+
+    root = 0
+
+    def __init__(self, offsets, parents, values, label_ids, labels):
+        self.offsets = offsets
+        self.parents = parents
+        self.values = values
+        self.label_ids = label_ids
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return '%s( %d nodes )' % (self.__class__.__name__, len(self))
+
+    @property
+    def nbytes(self):
+        """Size of the columns, not counting the label strings"""
+        return sum([
+            column.itemsize * len(column)
+            for column in (self.offsets, self.parents, self.values, self.label_ids)
+        ])
+
+    def children(self, node):
+        """Return the range of the children of the node"""
+        return range(self.offsets[node], self.offsets[node + 1])
+
+    def parent(self, node):
+        """Return the parent of the node, None for the root"""
+        parent = self.parents[node]
+        return None if parent < 0 else parent
+
+    def value(self, node):
+        return self.values[node]
+
+    def label(self, node):
+        return self.labels[self.label_ids[node]]
+
+    @classmethod
+    def from_node(class_, root, adapter=None):
+        """Convert a tree of Node (or adapter-described) objects
+
+        adapter -- if provided, its children, value and label methods are used
+            instead of the Node attributes
+        """
+        if adapter is None:
+            children_of = lambda node: node.children
+            value_of = lambda node, parent: node.value
+            label_of = lambda node: str(node.name)
+        else:
+            children_of = adapter.children
+            value_of = adapter.value
+            label_of = adapter.label
+        offsets = array('q', [1])
+        parents = array('q')
+        values = array('d')
+        label_ids = array('l')
+        labels = []
+        interned = {}
+        queue = deque([(root, None, -1)])
+        count = 1
+        while queue:
+            node, parent, parent_index = queue.popleft()
+            index = len(values)
+            parents.append(parent_index)
+            values.append(value_of(node, parent))
+            label = label_of(node)
+            label_id = interned.get(label)
+            if label_id is None:
+                label_id = interned[label] = len(labels)
+                labels.append(label)
+            label_ids.append(label_id)
+            for child in children_of(node) or ():
+                queue.append((child, node, index))
+                count += 1
+            offsets.append(count)
+        return class_(offsets, parents, values, label_ids, labels)
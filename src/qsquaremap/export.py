@@ -0,0 +1,374 @@
+"""Render maps to PNG or SVG files without a window
+
+The ``qsquaremap-export`` command renders a directory tree, the
+export_map function any model.  Both use the offscreen Qt platform unless
+a QApplication already exists or QT_QPA_PLATFORM says otherwise.
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent import futures
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+from .qsquaremap import DefaultAdapter, LayoutEngine, Node, TiledRenderer
+from qtpy import QtCore, QtGui, QtWidgets
+
+
+# the QApplication created by ensure_application, PyQt destroys it with its last reference
+_application = None
+
+
+def ensure_application():
+    """Return the QApplication, creating an offscreen one if there is none
+
+    The one created is kept for the life of the process.
+    """
+    global _application
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        app = _application = QtWidgets.QApplication(sys.argv[:1])
+    return app
+
+
+class PNGWriter:
+    """Minimal streaming PNG encoder for 8 bit RGBA images
+
+    Rows are compressed and written as they are given, so the image never
+    needs to be in memory as a whole.
+    """
+
+    signature = b'\x89PNG\r\n\x1a\n'
+
+    def __init__(self, file, width, height, level=6):
+        self.file = file
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self._compressor = zlib.compressobj(level)
+        file.write(self.signature)
+        # 8 bits per channel, color type 6 (RGBA), no interlace
+        self.chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def writeRows(self, data, stride=None):
+        """Write the rows of RGBA pixels in data, stride bytes apart"""
+        row_size = self.width * 4
+        stride = stride or row_size
+        count = len(data) // stride
+        # each row starts with its filter type, 0 is none
+        rows = b''.join([
+            b'\x00' + data[offset:offset + row_size]
+            for offset in range(0, count * stride, stride)
+        ])
+        self.rows += count
+        compressed = self._compressor.compress(rows)
+        if compressed:
+            self.chunk(b'IDAT', compressed)
+
+    def close(self):
+        if self.rows != self.height:
+            raise ValueError('%d rows written, the image has %d' % (self.rows, self.height))
+        self.chunk(b'IDAT', self._compressor.flush())
+        self.chunk(b'IEND', b'')
+
+
+def image_bytes(image):
+    """Return the pixel data of the QImage"""
+    bits = image.constBits()
+    if hasattr(bits, 'setsize'):
+        # PyQt's sip.voidptr
+        bits.setsize(image.sizeInBytes())
+    return bytes(bits)
+
+
+def export_png(layout, filename, renderer):
+    """Write the layout to a PNG file, one strip of tiles at a time"""
+    width, height = renderer.imageSize(layout)
+    size = renderer.tile_size
+    with open(filename, 'wb') as file:
+        writer = PNGWriter(file, width, height)
+        for top in range(0, height, size):
+            strip_height = min(size, height - top)
+            strip = QtGui.QImage(
+                width, strip_height, QtGui.QImage.Format.Format_ARGB32_Premultiplied
+            )
+            strip.fill(QtCore.Qt.GlobalColor.transparent)
+            tiles = [
+                QtCore.QRect(left, top, min(size, width - left), strip_height)
+                for left in range(0, width, size)
+            ]
+            painter = QtGui.QPainter(strip)
+            try:
+                for tile, image in renderer.renderTiles(layout, tiles):
+                    painter.drawImage(QtCore.QPoint(tile.x(), 0), image)
+            finally:
+                painter.end()
+            strip = strip.convertToFormat(QtGui.QImage.Format.Format_RGBA8888)
+            writer.writeRows(image_bytes(strip), strip.bytesPerLine())
+        writer.close()
+
+
+def export_svg(layout, filename, renderer):
+    """Write the layout to an SVG file with the LayoutRenderer"""
+    from qtpy import QtSvg
+
+    rect = QtCore.QRectF(*layout.rect).toAlignedRect()
+    generator = QtSvg.QSvgGenerator()
+    generator.setFileName(str(filename))
+    generator.setSize(rect.size())
+    generator.setViewBox(rect)
+    generator.setTitle('QSquareMap')
+    painter = QtGui.QPainter(generator)
+    try:
+        renderer.render(painter, layout.boxes())
+    finally:
+        painter.end()
+
+
+def export_map(
+    model,
+    filename,
+    width,
+    height,
+    adapter=None,
+    labels=True,
+    tile_size=1024,
+    threads=None,
+    renderer=None,
+    **options
+):
+    """Render the model to filename, a PNG or SVG file (as per its suffix)
+
+    adapter -- a DefaultAdapter or same-interface instance, DefaultAdapter by default
+    labels -- set to True (default) to draw textual labels within the boxes
+    tile_size, threads -- see TiledRenderer; PNG files are written one row of
+    tiles at a time, other raster formats are rendered whole and saved by Qt.
+    threads defaults to the number of CPUs if the adapter is
+    thread_safe_rendering, 1 otherwise
+    renderer -- a TiledRenderer to reuse (with its caches) instead of adapter,
+    labels, tile_size and threads
+    options -- LayoutEngine options: padding, margin, square_style, squarified,
+    min_area, max_depth and ordered
+    """
+    ensure_application()
+    if renderer is None:
+        adapter = adapter or DefaultAdapter()
+        if threads is None and not getattr(adapter, 'thread_safe_rendering', False):
+            threads = 1
+        renderer = TiledRenderer(adapter, labels=labels, tile_size=tile_size, threads=threads)
+    layout = LayoutEngine(renderer.adapter, **options).layout(
+        model, QtCore.QRectF(0, 0, width, height)
+    )
+    suffix = Path(filename).suffix.lower()
+    if suffix == '.svg':
+        export_svg(layout, filename, renderer.renderer())
+    elif suffix == '.png':
+        export_png(layout, filename, renderer)
+    elif not renderer.render(layout).save(str(filename)):
+        raise IOError('Unable to write %s' % (filename,))
+
+
+class BatchReport:
+    """Outcome of render_batch: images written, time taken and worker memory"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # peak resident memory in bytes per worker process id, None if unknown
+        self.memory = {}
+
+    @property
+    def images_per_second(self):
+        return self.count / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        lines = ['%d images in %.2f s, %.1f images/s, %d workers' % (
+            self.count, self.seconds, self.images_per_second, len(self.memory),
+        )]
+        for pid, memory in sorted(self.memory.items()):
+            lines.append('  worker %d: %s' % (
+                pid, 'unknown' if memory is None else '%.1f MB peak' % (memory / 1e6),
+            ))
+        return '\n'.join(lines)
+
+
+def peak_memory():
+    """Return the peak resident memory of this process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, but bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# state of a render_batch worker process, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(adapter_factory, loader, width, height, options):
+    options = dict(options)
+    # whatever platform the parent process uses, workers have no window
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    adapter = adapter_factory() if adapter_factory is not None else DefaultAdapter()
+    _worker.update(
+        app=ensure_application(),
+        renderer=TiledRenderer(
+            adapter,
+            labels=options.pop('labels', True),
+            tile_size=options.pop('tile_size', 1024),
+            threads=1,
+        ),
+        loader=loader,
+        width=width,
+        height=height,
+        options=options,
+    )
+
+
+def _render_job(job):
+    source, filename = job
+    loader, renderer = _worker['loader'], _worker['renderer']
+    export_map(
+        loader(source) if loader is not None else source,
+        filename,
+        _worker['width'],
+        _worker['height'],
+        renderer=renderer,
+        **_worker['options']
+    )
+    # the labels of this model's nodes, the prepared texts are kept
+    renderer.renderer().label_cache.labels.clear()
+    return os.getpid(), peak_memory()
+
+
+def _render_jobs(jobs):
+    """Render a batch of jobs, return the (pid, peak memory) of each"""
+    return [_render_job(job) for job in jobs]
+
+
+def render_batch(
+    jobs,
+    width=256,
+    height=256,
+    loader=None,
+    adapter_factory=None,
+    workers=None,
+    chunksize=4,
+    **options
+):
+    """Render many maps to image files on a pool of worker processes
+
+    jobs -- iterable of (model, filename) pairs, or (source, filename) with loader
+    loader -- if provided, called with the source of each job in the worker to get
+    its model (e.g. load_directory), so that models are not sent to the workers
+    adapter_factory -- callable returning the adapter of each worker, which is kept
+    for all its jobs; DefaultAdapter by default
+    workers -- number of processes, defaults to the number of CPUs
+    chunksize -- number of jobs sent to a worker at once; jobs are read as
+    needed, at most two chunks per worker are pending
+    options -- other export_map and LayoutEngine options
+
+    Each worker creates its offscreen QApplication once.  Workers are started
+    fresh (spawned), so loader, adapter_factory and models must be picklable,
+    e.g. module level functions and classes.
+
+    Returns a BatchReport.
+    """
+    report = BatchReport()
+    start = time.perf_counter()
+    jobs = iter(jobs)
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with futures.ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(adapter_factory, loader, width, height, options),
+    ) as pool:
+        while True:
+            chunk = list(itertools.islice(jobs, chunksize))
+            if chunk:
+                pending.append(pool.submit(_render_jobs, chunk))
+                if len(pending) < 2 * workers:
+                    continue
+            if not pending:
+                break
+            for pid, memory in pending.popleft().result():
+                report.count += 1
+                report.memory[pid] = memory
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def load_directory(path):
+    """Return the Node tree of the files (sized in bytes) under path"""
+    path = Path(path)
+    nodes = []
+    for name in sorted(path.iterdir()):
+        if name.is_symlink():
+            continue
+        if name.is_file():
+            nodes.append(Node(name, name.stat().st_size, ()))
+        elif name.is_dir() and name.name[0] != '.':
+            nodes.append(load_directory(name))
+    return Node(path, sum([node.value for node in nodes]), nodes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Render the files under a directory as a square-map image'
+    )
+    parser.add_argument('directory', help='directory to render')
+    parser.add_argument('output', help='PNG or SVG file to write')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--padding', type=int, default=3)
+    parser.add_argument('--margin', type=int, default=5)
+    parser.add_argument('--square-style', action='store_true')
+    parser.add_argument('--squarified', action='store_true')
+    parser.add_argument('--min-area', type=float, help='aggregate smaller boxes')
+    parser.add_argument('--max-depth', type=int)
+    parser.add_argument('--no-labels', action='store_true')
+    parser.add_argument('--tile-size', type=int, default=1024)
+    parser.add_argument(
+        '--threads', type=int,
+        help='tile rendering threads, 1 by default as DefaultAdapter is not thread safe',
+    )
+    args = parser.parse_args(argv)
+
+    export_map(
+        load_directory(args.directory),
+        args.output,
+        args.width,
+        args.height,
+        labels=not args.no_labels,
+        tile_size=args.tile_size,
+        threads=args.threads,
+        padding=args.padding,
+        margin=args.margin,
+        square_style=args.square_style,
+        squarified=args.squarified,
+        min_area=args.min_area,
+        max_depth=args.max_depth,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1021 @@
+"""Layout of nested-box trees, without any Qt dependency
+
+Rectangles are Rect tuples of floats, which QSquareMap converts to QRectF
+for painting.  Importing this module neither imports a Qt binding nor
+needs a QApplication, so layouts can be computed in servers and worker
+processes.
+"""
+import logging, operator, sys, time
+from collections import OrderedDict, deque
+
+from .spatial import RectIndex
+from . import vectorized
+
+log = logging.getLogger('squaremap')
+
+
+def point_xy(point):
+    """Return the x, y coordinates of a (x, y) tuple or QPointF"""
+    if isinstance(point, tuple):
+        return point
+    return point.x(), point.y()
+
+
+class Rect(tuple):
+    """Rectangle (x, y, width, height) of floats
+
+    It implements the read-only part of the QRectF interface used by the
+    layout and the renderers, ``QRectF(*rect)`` converts it.
+    """
+
+    __slots__ = ()
+
+    def __new__(class_, x=0.0, y=0.0, width=0.0, height=0.0):
+        return tuple.__new__(class_, (x, y, width, height))
+
+    @classmethod
+    def of(class_, rect):
+        """Return rect, a QRectF or (x, y, width, height) sequence, as a Rect"""
+        if isinstance(rect, class_):
+            return rect
+        if isinstance(rect, (tuple, list)):
+            return class_(*rect)
+        return class_(rect.x(), rect.y(), rect.width(), rect.height())
+
+    def __repr__(self):
+        return '%s( %r, %r, %r, %r )' % ((self.__class__.__name__,) + tuple(self))
+
+    def x(self):
+        return self[0]
+
+    def y(self):
+        return self[1]
+
+    def width(self):
+        return self[2]
+
+    def height(self):
+        return self[3]
+
+    left = x
+    top = y
+
+    def right(self):
+        return self[0] + self[2]
+
+    def bottom(self):
+        return self[1] + self[3]
+
+    def getRect(self):
+        return tuple(self)
+
+    def isNull(self):
+        return self[2] == 0 and self[3] == 0
+
+    def isEmpty(self):
+        return self[2] <= 0 or self[3] <= 0
+
+    def adjusted(self, left, top, right, bottom):
+        x, y, width, height = self
+        return Rect(x + left, y + top, width - left + right, height - top + bottom)
+
+    def contains(self, point):
+        """Whether the point, a (x, y) tuple or QPointF, is within the rectangle (borders included)"""
+        px, py = point_xy(point)
+        x, y, width, height = self
+        return x <= px <= x + width and y <= py <= y + height
+
+    def intersects(self, rect):
+        """Whether the rectangles, this one and a Rect or QRectF, overlap"""
+        if not isinstance(rect, tuple):
+            rect = rect.x(), rect.y(), rect.width(), rect.height()
+        x, y, width, height = self
+        other_x, other_y, other_width, other_height = rect
+        if not (width and height and other_width and other_height):
+            return False
+        return (
+            x < other_x + other_width
+            and other_x < x + width
+            and y < other_y + other_height
+            and other_y < y + height
+        )
+
+    def united(self, rect):
+        """Return the bounding rectangle of this one and the Rect rect"""
+        if self.isNull():
+            return rect
+        if rect.isNull():
+            return self
+        left = min(self[0], rect[0])
+        top = min(self[1], rect[1])
+        return Rect(
+            left,
+            top,
+            max(self[0] + self[2], rect[0] + rect[2]) - left,
+            max(self[1] + self[3], rect[1] + rect[3]) - top,
+        )
+
+
+class LayoutBox:
+    '''A laid out model-node: its geometry and its children's boxes.
+
+    A LayoutBox unpacks as the ``(rect, node, children)`` hot map entry, so
+    a list of boxes is a hot map usable with HotMapNavigator.
+    '''
+
+    __slots__ = (
+        'rect', 'node', 'children', 'depth', 'drect', 'radius', 'labels', 'index',
+        'parent', 'siblings', 'position',
+    )
+
+    def __init__(self, rect, node, depth=0):
+        self.rect = rect
+        self.node = node
+        self.children = []
+        self.depth = depth
+        self.drect = rect
+        self.radius = 0
+        self.labels = ()
+        self.index = None
+        # where the box is in the hot map: parent box, its children list and index in it
+        self.parent = None
+        self.siblings = None
+        self.position = 0
+
+    def __iter__(self):
+        return iter((self.rect, self.node, self.children))
+
+    def __getitem__(self, index):
+        return (self.rect, self.node, self.children)[index]
+
+    def __len__(self):
+        return 3
+
+    def __repr__(self):
+        return '%s( %r, %r, %r )' % (
+            self.__class__.__name__,
+            self.rect,
+            self.node,
+            self.depth,
+        )
+
+    def addLabel(self, rect):
+        '''Request the node label to be drawn within rect.'''
+        self.labels += (rect,)
+
+    def indexChildren(self):
+        '''Build the spatial index used to hit-test the children boxes.'''
+        self.index = RectIndex([
+            (x, y, x + width, y + height)
+            for x, y, width, height in [child.rect for child in self.children]
+        ])
+
+
+def walk_boxes(boxes, rect=None):
+    '''Iterate over the boxes and all their descendants in drawing (pre-)order.
+
+    rect -- if provided, skip the boxes (and so their children) not intersecting it
+    '''
+    stack = list(boxes)[::-1]
+    while stack:
+        box = stack.pop()
+        if rect is not None and not box.rect.intersects(rect):
+            continue
+        yield box
+        stack.extend(box.children[::-1])
+
+
+class Layout:
+    '''Result of a layout pass: the hot map of the laid out boxes.'''
+
+    # rough memory use of a box with its rectangles, labels and index entries
+    box_nbytes = 512
+
+    def __init__(self, rect):
+        self.rect = rect
+        self.hot_map = []
+        self.boxes_by_node = {}
+        self.max_depth_seen = 0
+
+    @property
+    def nbytes(self):
+        '''Approximate memory use of the layout.'''
+        return len(self.boxes_by_node) * self.box_nbytes
+
+    def boxes(self, rect=None):
+        '''Iterate over all boxes (intersecting rect) in drawing (pre-)order.'''
+        return walk_boxes(self.hot_map, rect)
+
+    def box(self, node):
+        '''Return the box of the given node, None if it was not laid out.'''
+        return self.boxes_by_node.get(node)
+
+    def findNode(self, node):
+        '''Return (parent node, sibling hot map, index) of the node, None if not laid out.
+
+        This is the constant time equivalent of HotMapNavigator.findNode.
+        '''
+        box = self.boxes_by_node.get(node)
+        if box is None:
+            return None
+        parent = None if box.parent is None else box.parent.node
+        return parent, box.siblings, box.position
+
+    def boxAtPosition(self, position):
+        '''Return the deepest box containing the position, None if there is none.
+
+        position -- a (x, y) tuple or QPointF
+        '''
+        x, y = point_xy(position)
+        found = None
+        boxes, index = self.hot_map, None
+        while boxes:
+            if index is not None:
+                position_index = index.find(x, y)
+                if position_index is None:
+                    break
+                box = boxes[position_index]
+            else:
+                for box in boxes:
+                    if box.rect.contains(position):
+                        break
+                else:
+                    break
+            found = box
+            boxes, index = box.children, box.index
+        return found
+
+    def nodeAtPosition(self, position):
+        '''Return the node of the deepest box containing the position.'''
+        box = self.boxAtPosition(position)
+        return None if box is None else box.node
+
+
+class LayoutCache:
+    """Least recently used Layouts, up to budget bytes (as estimated by Layout.nbytes)"""
+
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget
+        self.nbytes = 0
+        self._layouts = OrderedDict()
+
+    def __len__(self):
+        return len(self._layouts)
+
+    def get(self, key):
+        """Return the layout cached for key, None if there is none"""
+        entry = self._layouts.get(key)
+        if entry is None:
+            return None
+        self._layouts.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, layout):
+        """Cache the layout, dropping the least recently used ones to stay within budget"""
+        self.discard(key)
+        nbytes = layout.nbytes
+        if nbytes > self.budget:
+            return
+        self._layouts[key] = layout, nbytes
+        self.nbytes += nbytes
+        while self.nbytes > self.budget:
+            layout, nbytes = self._layouts.popitem(last=False)[1]
+            self.nbytes -= nbytes
+
+    def discard(self, key):
+        entry = self._layouts.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        self._layouts.clear()
+        self.nbytes = 0
+
+
+class LayoutEngine:
+    """Compute the boxes of a nested-box tree without painting them"""
+
+    # children of a box are hit-tested through a spatial index above this count
+    index_threshold = 16
+    # strip sliced children are laid out by the NumPy kernel above this count,
+    # None to never use it; only applies when NumPy is installed.  Off by
+    # default: building a box per child from the arrays costs more than the
+    # kernel saves
+    vectorize_threshold = None
+
+    def __init__(
+        self,
+        adapter,
+        padding=3,
+        margin=5,
+        square_style=False,
+        max_depth=None,
+        squarified=False,
+        min_area=None,
+        ordered=False,
+    ):
+        self.adapter = complete_adapter(adapter)
+        self.padding = padding
+        self.margin = margin
+        self.square_style = square_style
+        self.max_depth = max_depth
+        self.squarified = squarified
+        self.min_area = min_area
+        self.ordered = ordered
+        self.max_depth_seen = 0
+        self.cancelled = False
+        # (box, children, rect) whose children are left for refine(), None
+        # when laying out everything at once
+        self.deferred = None
+
+    def cancel(self):
+        """Abort the running layout pass, which raises LayoutCancelled"""
+        self.cancelled = True
+
+    def layout(self, model, rect):
+        """Lay the model out within rect, a Rect, QRectF or (x, y, width, height)
+
+        Returns the resulting Layout.
+        """
+        self.deferred = None
+        rect = Rect.of(rect)
+        layout = Layout(rect)
+        self.max_depth_seen = 0
+        self.LayoutNode(model, rect, layout.hot_map)
+        layout.max_depth_seen = self.max_depth_seen
+        self.indexBoxes(layout, layout.hot_map)
+        return layout
+
+    def beginLayout(self, model, rect):
+        """Start a progressive layout pass, only the box of the model is laid out
+
+        Its descendants are laid out breadth first by refine(), which is
+        called until complete is True; the returned Layout grows meanwhile.
+        """
+        rect = Rect.of(rect)
+        layout = Layout(rect)
+        self.deferred = deque()
+        self.max_depth_seen = 0
+        self.LayoutNode(model, rect, layout.hot_map)
+        layout.max_depth_seen = self.max_depth_seen
+        self.indexBoxes(layout, layout.hot_map)
+        return layout
+
+    @property
+    def complete(self):
+        """Whether the progressive layout pass is done"""
+        return not self.deferred
+
+    def refine(self, layout, budget=None):
+        """Lay out the next level of deferred children into the layout
+
+        budget -- seconds to stop after, None to lay out everything; the
+            children of one box are always laid out together
+
+        Returns the new boxes, in drawing order.
+        """
+        deferred = self.deferred
+        if budget is not None:
+            deadline = time.perf_counter() + budget
+        boxes_by_node = layout.boxes_by_node
+        new = []
+        while deferred:
+            box, children, rect = deferred.popleft()
+            self.LayoutChildren(children, box.node, rect, box.children, box.depth + 1)
+            for position, child in enumerate(box.children):
+                child.parent, child.siblings, child.position = box, box.children, position
+                boxes_by_node[child.node] = child
+            if len(box.children) > self.index_threshold:
+                box.indexChildren()
+            new.extend(box.children)
+            if budget is not None and time.perf_counter() >= deadline:
+                break
+        layout.max_depth_seen = self.max_depth_seen
+        return new
+
+    def indexBoxes(self, layout, hot_map, parent=None):
+        """Register the boxes of the hot map and their descendants in the layout"""
+        for position, box in enumerate(hot_map):
+            box.parent, box.siblings, box.position = parent, hot_map, position
+        self.registerBoxes(layout, hot_map)
+
+    def registerBoxes(self, layout, boxes):
+        """Register the descendants of boxes, and the boxes themselves, in the layout"""
+        boxes_by_node = layout.boxes_by_node
+        for box in walk_boxes(boxes):
+            boxes_by_node[box.node] = box
+            for position, child in enumerate(box.children):
+                child.parent, child.siblings, child.position = box, box.children, position
+            if len(box.children) > self.index_threshold:
+                box.indexChildren()
+
+    def relayout(self, layout, node):
+        """Lay the boxes affected by a change to the node's data out again
+
+        Boxes keep their rectangle, going down from the root, as long as
+        their children boxes do not move: the subtrees of the children which
+        kept their node and rectangle are reused, the others are laid out
+        again in place.  The node's own subtree is always laid out again.
+
+        Returns the rectangle in which boxes changed (possibly empty), None
+        if the node is not laid out.
+        """
+        box = layout.box(node)
+        if box is None:
+            return None
+        path = []
+        while box is not None:
+            path.append(box)
+            box = box.parent
+        return self.updateBox(layout, path.pop(), path)[1]
+
+    def updateBox(self, layout, box, path):
+        """Lay the box out again, path is the boxes down to the changed one, last first
+
+        Returns the box, or the one which replaced it, and the changed rectangle.
+        """
+        if not path:
+            box = self.replaceBox(layout, box)
+            return box, box.rect
+        shallow = self.layoutShallow(box)
+        if shallow is None or shallow.labels != box.labels:
+            box = self.replaceBox(layout, box)
+            return box, box.rect
+        next_box = path.pop()
+        dirty = Rect()
+        old_children = {}
+        for child in box.children:
+            old_children[box_key(child), child.rect.getRect()] = child
+        children, fresh = [], []
+        for child in shallow.children:
+            old = old_children.pop((box_key(child), child.rect.getRect()), None)
+            if old is None:
+                laid_out = []
+                self.LayoutNode(child.node, child.rect, laid_out, child.depth)
+                child = laid_out[0]
+                fresh.append(child)
+                dirty = dirty.united(child.rect)
+            else:
+                child = old
+                if old is next_box:
+                    child, changed = self.updateBox(layout, old, path)
+                    dirty = dirty.united(changed)
+            children.append(child)
+        for old in old_children.values():
+            dirty = dirty.united(old.rect)
+            for gone in walk_boxes([old]):
+                if layout.boxes_by_node.get(gone.node) is gone:
+                    del layout.boxes_by_node[gone.node]
+        for position, child in enumerate(children):
+            child.parent, child.siblings, child.position = box, children, position
+        box.children = children
+        box.index = None
+        if len(children) > self.index_threshold:
+            box.indexChildren()
+        self.registerBoxes(layout, fresh)
+        layout.max_depth_seen = max(layout.max_depth_seen, self.max_depth_seen)
+        return box, dirty
+
+    def layoutShallow(self, box):
+        """Lay the box's node out again with its children, but not their descendants"""
+        self.deferred = deque()
+        try:
+            hot_map = []
+            self.LayoutNode(box.node, box.rect, hot_map, box.depth)
+            if self.deferred:
+                new, children, rect = self.deferred.popleft()
+                self.LayoutChildren(children, new.node, rect, new.children, new.depth + 1)
+        finally:
+            self.deferred = None
+        return hot_map[0] if hot_map else None
+
+    def replaceBox(self, layout, box):
+        """Lay the box's node out again, in the same rectangle, and return the new box"""
+        hot_map = []
+        self.LayoutNode(box.node, box.rect, hot_map, box.depth)
+        for old in walk_boxes([box]):
+            if layout.boxes_by_node.get(old.node) is old:
+                del layout.boxes_by_node[old.node]
+        new = hot_map[0]
+        new.parent, new.siblings, new.position = box.parent, box.siblings, box.position
+        # same rectangle, so a spatial index of the siblings is still valid
+        box.siblings[box.position] = new
+        self.registerBoxes(layout, [new])
+        layout.max_depth_seen = max(layout.max_depth_seen, self.max_depth_seen)
+        return new
+
+    def LayoutNode(self, node, rect, hot_map, depth=0):
+        """Lay out a model-node's box and all children nodes"""
+        log.debug('Layout: %s to %s depth=%s', node, rect, depth)
+        if self.cancelled:
+            raise LayoutCancelled()
+        if self.max_depth and depth > self.max_depth:
+            return
+        if depth > self.max_depth_seen:
+            self.max_depth_seen = depth
+        box = LayoutBox(rect, node, depth)
+        # plain tuple arithmetic, this runs once per box
+        x, y, width, height = rect
+        margin, padding = self.margin, self.padding
+        # drawing offset by margin within the square...
+        drect_width = width - margin - margin
+        drect_height = height - margin - margin
+        box.drect = tuple.__new__(Rect, (x + margin, y + margin, drect_width, drect_height))
+        if sys.platform == 'darwin':
+            # Macs don't like drawing small rounded rects...
+            if width >= padding * 2 and height >= padding * 2:
+                box.radius = padding
+        else:
+            # On modern machines, padding can be a *huge* number, far larger than
+            # the dw/dh, so this reduces radius on small boxes and switches to square
+            # boxes when extremely small
+            pad = padding * 3
+            if drect_width <= pad * 2 or drect_height <= pad * 2:
+                pad = min([drect_width // 2, drect_height // 2])
+                if pad < 1:
+                    pad = 0
+            if pad:
+                box.radius = pad
+            else:
+                box.labels = (rect,)
+        hot_map.append(box)
+
+        rect = tuple.__new__(
+            Rect, (x + padding, y + padding, width - padding - padding, height - padding - padding)
+        )
+
+        if isinstance(node, AggregateNode):
+            if rect.width() > self.padding * 2 and rect.height() > self.padding * 2:
+                box.addLabel(rect)
+            return
+        empty = self.adapter.empty(node)
+        icon_drawn = False
+        if self.max_depth and depth == self.max_depth:
+            box.addLabel(rect)
+            icon_drawn = True
+        elif empty:
+            # is a fraction of the space which is empty...
+            log.debug('  empty space fraction: %s', empty)
+            box.addLabel(rect.adjusted(0, 0, 0, (rect.height() * empty)))
+            icon_drawn = True
+            rect = Rect(
+                rect.x(),
+                rect.y() + rect.height() * empty,
+                rect.width(),
+                rect.height() * (1.0 - empty),
+            )
+
+        if rect.width() > self.padding * 2 and rect.height() > self.padding * 2:
+            children = self.adapter.children(node)
+            if children and self.deferred is not None:
+                self.deferred.append((box, children, rect))
+            elif children:
+                log.debug('  children: %s', children)
+                self.LayoutChildren(
+                    children, node, rect, box.children, depth + 1
+                )
+            else:
+                log.debug('  no children')
+                if not icon_drawn:
+                    box.addLabel(rect)
+        else:
+            log.debug('  not enough space: children skipped')
+
+    def LayoutChildren(
+        self, children, parent, rect, hot_map, depth=0, node_sum=None
+    ):
+        """Layout the set of children in the given rectangle
+
+        node_sum -- if provided, children already is a sorted list of (value, node)
+            and node_sum their total, so skip those operations
+        """
+        if node_sum is None:
+            if self.vectorizable(children):
+                self.LayoutVectorized(children, parent, rect, hot_map, depth)
+                return
+            if self.ordered:
+                nodes = self.adapter.ordered_children(
+                    children, parent, None if self.ordered is True else self.ordered
+                )
+            else:
+                nodes = self.adapter.sorted_children(children, parent)
+            total = self.adapter.children_sum(children, parent)
+            if self.min_area and total:
+                nodes = self.aggregateSmall(nodes, total, rect, parent)
+        else:
+            nodes = children
+            total = node_sum
+        if self.squarified:
+            self.LayoutSquarified(nodes, total, rect, hot_map, depth)
+            return
+        padding = self.padding + self.margin
+        # (start, end, sum, rect) of the nodes[start:end] slices yet to lay out,
+        # the biggest nodes are at the end and are laid out first
+        pending = [(0, len(nodes), total, rect)]
+        while pending:
+            start, end, total, rect = pending.pop()
+            if not total:
+                continue
+            if self.square_style and end - start > 5:
+                # new handling to make parents with large numbers of parents a little less
+                # "sliced" looking (i.e. more square)
+                head_sum, divider = split_index_by_value(total, nodes, start, end)
+                if start < divider < end:
+                    # split into two sub-boxes and lay out each, head first...
+                    head_coord, tail_coord = split_box(
+                        head_sum / float(total), rect
+                    )
+                    if tail_coord and coord_bigger_than_padding(tail_coord, padding):
+                        pending.append((start, divider, total - head_sum, tail_coord))
+                    if head_coord:
+                        pending.append((divider, end, head_sum, head_coord))
+                    continue
+
+            (firstSize, firstNode) = nodes[end - 1]
+            fraction = firstSize / float(total)
+            head_coord, tail_coord = split_box(fraction, rect)
+            if head_coord:
+                self.LayoutNode(
+                    firstNode,
+                    head_coord,
+                    hot_map,
+                    depth,
+                )
+            else:
+                continue  # no other node will show up as non-0 either
+
+            if (
+                end - start > 1
+                and tail_coord
+                and coord_bigger_than_padding(tail_coord, padding)
+            ):
+                pending.append((start, end - 1, total - firstSize, tail_coord))
+
+
+    def vectorizable(self, children):
+        """Whether the children are laid out by the NumPy kernel"""
+        return (
+            self.vectorize_threshold is not None
+            and not self.square_style
+            and not self.squarified
+            and not self.min_area
+            and not self.ordered
+            and len(children) > self.vectorize_threshold
+            # last, NumPy is imported on first need
+            and vectorized.load_numpy() is not None
+        )
+
+    def aggregateSmall(self, nodes, total, rect, parent):
+        """Replace the sorted (value, node) entries smaller than min_area by an AggregateNode
+
+        The aggregate comes last in layout order, whatever its value.
+        """
+        area = rect.width() * rect.height()
+        if area <= 0:
+            return nodes
+        threshold = self.min_area * total / float(area)
+        if self.ordered:
+            small = [entry for entry in nodes if entry[0] < threshold]
+            if len(small) < 2:
+                return nodes
+            nodes = [entry for entry in nodes if entry[0] >= threshold]
+            value = sum([value for value, node in small])
+            aggregate = AggregateNode(parent, [node for value, node in small], value)
+            return [(value, aggregate)] + nodes
+        # nodes are sorted by value: find how many are below the threshold
+        low, high = 0, len(nodes)
+        while low < high:
+            middle = (low + high) // 2
+            if nodes[middle][0] < threshold:
+                low = middle + 1
+            else:
+                high = middle
+        if low < 2:
+            return nodes
+        value = sum([value for value, node in nodes[:low]])
+        aggregate = AggregateNode(parent, [node for value, node in nodes[:low]], value)
+        return [(value, aggregate)] + nodes[low:]
+
+    def LayoutVectorized(self, children, parent, rect, hot_map, depth=0):
+        """Layout the children with the NumPy strip slicing kernel
+
+        Same boxes as the strip slicing of LayoutChildren (up to rounding),
+        without sorting or splitting rectangles in Python.
+        """
+        children = list(children)
+        order, rects = vectorized.slice_layout(
+            self.adapter.children_values(children, parent),
+            rect.x(),
+            rect.y(),
+            rect.width(),
+            rect.height(),
+            padding=self.padding + self.margin,
+            total=self.adapter.children_sum(children, parent),
+        )
+        for index, (x, y, width, height) in zip(order.tolist(), rects.tolist()):
+            self.LayoutNode(
+                children[index], Rect(x, y, width, height), hot_map, depth
+            )
+
+    def LayoutSquarified(self, nodes, total, rect, hot_map, depth=0):
+        """Layout the sorted (value, node) list in rows of the squarified treemap
+
+        Bruls, Huizing, van Wijk: the biggest nodes go first, a row along the
+        shorter side of the remaining rectangle grows while that improves its
+        worst aspect ratio.  Every node is looked at no more than twice.
+        """
+        padding = self.padding + self.margin
+        end = len(nodes)
+        while end and total > 0:
+            width, height = rect.width(), rect.height()
+            short = min(width, height)
+            # node values to areas
+            scale = width * height / float(total)
+            if not short or not scale:
+                return
+            short2 = short * short
+            # the extremes of the row, which is not sorted in ordered mode
+            largest, smallest = 0.0, None
+            start, row_area, worst = end, 0.0, None
+            while start:
+                area = nodes[start - 1][0] * scale
+                if area <= 0:
+                    break
+                grown = row_area + area
+                largest = max(largest, area)
+                smallest = area if smallest is None else min(smallest, area)
+                grown2 = grown * grown
+                ratio = max(short2 * largest / grown2, grown2 / (short2 * smallest))
+                if worst is not None and ratio > worst:
+                    break
+                start, row_area, worst = start - 1, grown, ratio
+            if start == end:
+                return  # no other node will show up as non-0 either
+            row_sum = sum([value for value, node in nodes[start:end]])
+            x, y = rect.left(), rect.top()
+            if width >= height:
+                # a column along the left side
+                row_width = width * row_sum / float(total)
+                for index in range(end - 1, start - 1, -1):
+                    value, node = nodes[index]
+                    node_height = height * value / float(row_sum)
+                    self.LayoutNode(node, Rect(x, y, row_width, node_height), hot_map, depth)
+                    y += node_height
+                rect = rect.adjusted(row_width, 0, 0, 0)
+            else:
+                # a row along the top side
+                row_height = height * row_sum / float(total)
+                for index in range(end - 1, start - 1, -1):
+                    value, node = nodes[index]
+                    node_width = width * value / float(row_sum)
+                    self.LayoutNode(node, Rect(x, y, node_width, row_height), hot_map, depth)
+                    x += node_width
+                rect = rect.adjusted(0, row_height, 0, 0)
+            end = start
+            total -= row_sum
+            if not coord_bigger_than_padding(rect, padding):
+                return
+
+
+
+class LayoutCancelled(Exception):
+    """Raised by a layout pass cancelled through LayoutEngine.cancel()"""
+
+
+
+class AggregateNode:
+    """Stand-in for the children of a node too small to be drawn on their own
+
+    It gets its own box, hot map entry and signals like any other node, but
+    its children are never asked to the adapter.
+    """
+
+    def __init__(self, parent, nodes, value):
+        self.parent = parent
+        self.nodes = nodes
+        self.value = value
+        self.children = ()
+
+    @property
+    def name(self):
+        return '%d more' % len(self.nodes)
+
+    def __repr__(self):
+        return '%s( %r, %r )' % (
+            self.__class__.__name__,
+            self.name,
+            self.value,
+        )
+
+
+def box_key(box):
+    """Identify the node of a box across layouts, AggregateNodes are recreated each time"""
+    node = box.node
+    if isinstance(node, AggregateNode):
+        return AggregateNode, node.value, len(node.nodes)
+    return node
+
+def coord_bigger_than_padding(tail_coord, padding):
+    return tail_coord and tail_coord.width() > padding * 2 and tail_coord.height() > padding * 2
+
+
+def split_box(fraction, rect):
+    """
+    Return set of two boxes where first is the fraction given
+    """
+    head, tail = None, None
+    x, y, w, h = rect
+
+    # as rect.adjusted() would, without its overhead
+    if w >= h:
+        head_w = w * fraction
+        if head_w:
+            head = tuple.__new__(Rect, (x, y, w - (w - head_w), h))
+            tail = tuple.__new__(Rect, (x + head_w, y, w - head_w, h))
+    else:
+        head_h = h * fraction
+        if head_h:
+            head = tuple.__new__(Rect, (x, y, w, h - (h - head_h)))
+            tail = tuple.__new__(Rect, (x, y + head_h, w, h - head_h))
+
+    return head, tail
+
+
+def split_by_value(total, nodes, headdivisor=2.0):
+    """Produce, (sum,head),(sum,tail) for nodes to attempt binary partition"""
+    head_sum = 0
+    divider = 0
+    for node in nodes[::-1]:
+        if head_sum < total / headdivisor:
+            head_sum += node[0]
+            divider -= 1
+        else:
+            break
+    return (head_sum, nodes[divider:]), (total - head_sum, nodes[:divider])
+
+
+def split_index_by_value(total, nodes, start, end, headdivisor=2.0):
+    """Like split_by_value for nodes[start:end], without copying the nodes
+
+    Returns head_sum, divider: the head is nodes[divider:end] and the tail
+    nodes[start:divider].
+    """
+    head_sum = 0
+    divider = end
+    while divider > start and head_sum < total / headdivisor:
+        divider -= 1
+        head_sum += nodes[divider][0]
+    return head_sum, divider
+
+
+
+class NodeAdapter:
+    """Adapter of node-trees to the layout: children and values of the nodes
+
+    DefaultAdapter adds the colors, fonts and icons QSquareMap paints with.
+    """
+
+    # Whether the methods used for the layout (children, value, children_values,
+    # children_sum, sorted_children, overall and empty) may be called from a
+    # worker thread, allowing QSquareMap to lay out in the background.
+    thread_safe = False
+
+    def children(self, node):
+        """Retrieve the set of nodes which are children of this node"""
+        return node.children
+
+    def value(self, node, parent=None):
+        """Return value used to compare nodes"""
+        return node.value
+
+    def label(self, node):
+        """Return textual description of this node"""
+        return str(node.name)
+
+    def overall(self, node):
+        """Calculate overall value of the node including children and empty space"""
+        return sum([self.value(value, node) for value in self.children(node)])
+
+    def children_sum(self, children, node):
+        """Calculate children's total sum"""
+        return sum([self.value(value, node) for value in children])
+
+    def children_values(self, children, node):
+        """Return the sequence of the children values, in children order"""
+        return [self.value(child, node) for child in children]
+
+    def sorted_children(self, children, node):
+        """Return the list of (value, child) for the children, smallest value first"""
+        nodes = list(zip(self.children_values(children, node), children))
+        nodes.sort(key=operator.itemgetter(0))
+        return nodes
+
+    def ordered_children(self, children, node, key=None):
+        """Return the list of (value, child) for the children with a value, last child first
+
+        key -- if provided, the children are sorted by key(child) first
+        """
+        if key is not None:
+            children = sorted(children, key=key)
+        nodes = list(zip(self.children_values(children, node), children))
+        nodes.reverse()
+        return [entry for entry in nodes if entry[0] > 0]
+
+    # Whether overall is the sum of the children values, i.e. there is no empty
+    # space.  None means only if neither overall nor children_sum is overridden.
+    overall_is_children_sum = None
+
+    def overall_sums_children(self):
+        """Whether overall is the children sum (see overall_is_children_sum)"""
+        sums = self.overall_is_children_sum
+        if sums is None:
+            class_ = type(self)
+            sums = (
+                class_.overall is NodeAdapter.overall
+                and class_.children_sum is NodeAdapter.children_sum
+            )
+        return sums
+
+    def empty(self, node):
+        """Calculate empty space as a fraction of total space"""
+        if self.overall_sums_children():
+            return 0
+        overall = self.overall(node)
+        if overall:
+            return (overall - self.children_sum(self.children(node), node)) / float(
+                overall
+            )
+        return 0
+
+    def set_value(self, node, value):
+        """Store the new value of the node, see QSquareMap.updateNodeValue"""
+        node.value = value
+
+    def set_children(self, node, children):
+        """Store the new children of the node, see QSquareMap.replaceChildren"""
+        node.children = children
+
+    def invalidate(self, node):
+        """The data of the node changed, forget anything cached about it and its ancestors"""
+
+    def parents(self, node):
+        """Retrieve/calculate the set of parents for the given node"""
+        return []
+
+
+# the methods and flags of the adapter interface
+ADAPTER_NAMES = tuple([name for name in vars(NodeAdapter) if not name.startswith('_')])
+
+
+def complete_adapter(adapter):
+    """Return the adapter, wrapped if it lacks some of the NodeAdapter methods
+
+    Adapters need not derive from NodeAdapter, any object with the methods of
+    the original DefaultAdapter interface works: the wrapper provides the
+    NodeAdapter implementation of the missing ones.
+    """
+    if isinstance(adapter, NodeAdapter):
+        return adapter
+    if all([hasattr(adapter, name) for name in ADAPTER_NAMES]):
+        return adapter
+    return CompletedAdapter(adapter)
+
+
+class CompletedAdapter(NodeAdapter):
+    """NodeAdapter delegating to a duck-typed adapter, see complete_adapter"""
+
+    # unless the adapter says so, its overall may include empty space
+    overall_is_children_sum = False
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        # the adapter's own methods and flags win over the NodeAdapter ones
+        for name in ADAPTER_NAMES:
+            if hasattr(adapter, name):
+                setattr(self, name, getattr(adapter, name))
+
+    def __getattr__(self, name):
+        return getattr(self.adapter, name)
+
+
+def overrides(adapter, name):
+    """Whether the adapter implements the NodeAdapter method name its own way"""
+    method = getattr(adapter, name)
+    return getattr(method, '__func__', None) is not getattr(NodeAdapter, name)
+
+
+class Node:
+    """Really dumb file-system node object"""
+
+    def __init__(self, name, value, children):
+        self.name = name
+        self.value = value
+        self.children = children
+
+    def __repr__(self):
+        return '%s( %r, %r, %r )' % (
+            self.__class__.__name__,
+            self.name,
+            self.value,
+            self.children,
+        )
@@ -1,8 +1,35 @@
 
-import sys, os, logging, operator
-os.environ['QT_API'] = 'pyqt6'
+import os, logging, math, threading
+from collections import deque
+from concurrent import futures
+# the binding qtpy picks, unless the application chose one
+os.environ.setdefault('QT_API', 'pyqt6')
 from qtpy import QtWidgets, QtGui, QtCore
 
+from .arraytree import ArrayTree
+from .spatial import RectIndex
+from . import vectorized
+# the layout core, also imported from here by existing code
+from .layout import (
+    AggregateNode,
+    Layout,
+    LayoutBox,
+    LayoutCache,
+    LayoutCancelled,
+    LayoutEngine,
+    Node,
+    NodeAdapter,
+    Rect,
+    box_key,
+    complete_adapter,
+    coord_bigger_than_padding,
+    overrides,
+    split_box,
+    split_by_value,
+    split_index_by_value,
+    walk_boxes,
+)
+
 log = logging.getLogger('squaremap')
 # log.setLevel( logging.DEBUG )
 
@@ -65,17 +92,116 @@ class HotMapNavigator:
             return hot_map[-1][1]  # Return the last node
 
 
+
+class _LayoutTaskSignals(QtCore.QObject):
+    finished = QtCore.Signal(object, object)
+
+
+class LayoutTask(QtCore.QRunnable):
+    """Run a layout pass on a QThreadPool
+
+    The finished signal is emitted with the task and the resulting Layout,
+    it is not emitted when the task is cancelled.  Only use it with adapters
+    which are safe to call off the GUI thread.
+    """
+
+    def __init__(self, engine, model, rect):
+        super(LayoutTask, self).__init__()
+        self.engine = engine
+        self.model = model
+        self.rect = rect
+        self.signals = _LayoutTaskSignals()
+        self.finished = self.signals.finished
+
+    def cancel(self):
+        """Stop the layout pass as soon as possible"""
+        self.engine.cancel()
+
+    def run(self):
+        try:
+            layout = self.engine.layout(self.model, self.rect)
+        except LayoutCancelled:
+            log.debug('Layout of %s cancelled', self.model)
+        except Exception:
+            log.exception('Layout of %s failed', self.model)
+        else:
+            self.finished.emit(self, layout)
+
+
+
+class _LayoutOption:
+    '''QSquareMap attribute whose change invalidates the cached layout.'''
+
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = '_' + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return getattr(instance, self.name, self.default)
+
+    def __set__(self, instance, value):
+        setattr(instance, self.name, value)
+        instance._invalidateLayout()
+
+
+class _ModelOption(_LayoutOption):
+    '''QSquareMap attribute whose change invalidates the cached layouts and zoom.'''
+
+    def __set__(self, instance, value):
+        setattr(instance, self.name, value)
+        instance._modelChanged()
+
+
+class _RenderOption(_LayoutOption):
+    '''QSquareMap attribute whose change only invalidates the rendered map.'''
+
+    def __set__(self, instance, value):
+        setattr(instance, self.name, value)
+        instance._invalidateBackingStore()
+
+
 class QSquareMap(QtWidgets.QWidget):
     """Construct a nested-box trees structure view"""
 
     highlightNode = QtCore.Signal(object, object, object)
     selectNode = QtCore.Signal(object, object, object)
     activateNode = QtCore.Signal(object, object, object)
+    zoomNode = QtCore.Signal(object, object)
 
     BackgroundColour = QtGui.QColor(128, 128, 128)
-    max_depth = None
     max_depth_seen = None
 
+    # changing any of these invalidates all layouts
+    model = _ModelOption()
+    adapter = _ModelOption()
+    # changing any of these requires a new layout pass
+    padding = _LayoutOption(3)
+    margin = _LayoutOption(5)
+    square_style = _LayoutOption(False)
+    squarified = _LayoutOption(False)
+    min_area = _LayoutOption()
+    max_depth = _LayoutOption()
+    progressive = _LayoutOption(False)
+    ordered = _LayoutOption(False)
+    # changing any of these requires the map to be re-rendered
+    labels = _RenderOption(True)
+    # compute the layout on a QThreadPool when the adapter is thread_safe
+    background_layout = True
+    # seconds of progressive layout and painting per event loop iteration
+    frame_budget = 0.008
+    # move the boxes to their new place when zooming or changing the model
+    animate = False
+    # milliseconds
+    animation_duration = 250
+    # the map is rendered by a TiledRenderer on all CPUs from this many pixels
+    # on (about a 4K screen) when the adapter is thread_safe_rendering, None to
+    # always render on the GUI thread only
+    tiled_threshold = 3840 * 2160
+
     def __init__(
         self,
         parent=None,
@@ -86,7 +212,12 @@ class QSquareMap(QtWidgets.QWidget):
         highlight=True,
         padding=3,
         margin=5,
-        square_style=False
+        square_style=False,
+        squarified=False,
+        min_area=None,
+        progressive=False,
+        ordered=False,
+        animate=False,
     ):
         """Initialise the QSquareMap
 
@@ -97,12 +228,52 @@ class QSquareMap(QtWidgets.QWidget):
         margin -- spacing around each square (on all sides)
         square_style -- use a more-recursive, less-linear, more "square" layout style,
         but the layout is less obvious wrt what node is "next" "previous" etc.
+        squarified -- use the squarified treemap layout, its boxes are as square as
+        possible so more of them are big enough to show up; takes precedence over
+        square_style
+        min_area -- if provided, the children whose box would be smaller than this many
+        square pixels are drawn as a single "N more" box (an AggregateNode)
+        progressive -- lay out and paint the tree level by level, frame_budget
+        seconds at a time, so the top levels show up (and respond to the mouse)
+        while the deeper ones are still being laid out
+        ordered -- keep the children in the order of the adapter (True) or sorted by
+        the given key function instead of sorting them by value, so that value changes
+        only move the boxes next to the changed node around (see updateNodeValue)
+        animate -- move the boxes from their previous place to the new one when zooming
+        or changing the model, over animation_duration milliseconds
         """
         super(QSquareMap, self).__init__(parent)
         self.setObjectName(name)
+        self._layout = None
+        self._layout_task = None
+        self._backing_store = None
+        self._stale_backing_store = None
+        self._refinement = None
+        self._zoom_history = []
+        # child -> parent of the whole model, built on first need by _ancestors
+        self._parent_map = None
+        self.layout_cache = LayoutCache()
+        self._label_cache = LabelCache()
+        self._previous_layout = None
+        self._transition = None
+        self._transition_progress = 0.0
+        self._animation = QtCore.QVariantAnimation(self)
+        self._animation.setStartValue(0.0)
+        self._animation.setEndValue(1.0)
+        self._animation.setEasingCurve(QtCore.QEasingCurve.Type.OutCubic)
+        self._animation.valueChanged.connect(self._animationStep)
+        self._animation.finished.connect(self._animationFinished)
+        self.animate = animate
+        self._refine_timer = QtCore.QTimer(self)
+        self._refine_timer.setSingleShot(True)
+        self._refine_timer.timeout.connect(self._refineLayout)
         self.model = model
         self.padding = padding
         self.square_style = square_style
+        self.squarified = squarified
+        self.min_area = min_area
+        self.progressive = progressive
+        self.ordered = ordered
         self.margin = margin
         self.labels = labels
         self.setMouseTracking(highlight)
@@ -117,36 +288,57 @@ class QSquareMap(QtWidgets.QWidget):
         Handle mouse-move event by highlighting element under mouse pointer.
         Mouse tracking should be enabled to receive this event.
         """
-        node = HotMapNavigator.findNodeAtPosition(self.hot_map, event.position())
+        node = self.nodeAtPosition(event.position())
         self.setHighlightedNode(node, event.position())
 
     def mouseReleaseEvent(self, event):
         """Release over a given square in the map"""
-        node = HotMapNavigator.findNodeAtPosition(self.hot_map, event.position())
+        node = self.nodeAtPosition(event.position())
         self.setSelectedNode(node, event.position())
 
     def mouseDoubleClickEvent(self, event):
         """Double click on a given square in the map"""
-        node = HotMapNavigator.findNodeAtPosition(self.hot_map, event.position())
-        if node:
+        node = self.nodeAtPosition(event.position())
+        if node is not None:
             self.setActiveNode(node, event.position())
 
+    def nodeAtPosition(self, position):
+        """Return the node under the given position, None if there is none"""
+        if self._layout is None:
+            return HotMapNavigator.findNodeAtPosition(self.hot_map, position)
+        return self._layout.nodeAtPosition(position)
+
+    def findNode(self, node):
+        """
+        Find the hot map record of the node in constant time.
+
+        Args:
+            node (Node):
+                Node to look up.
+
+        Returns:
+            tuple: (parent node, sibling hot map, index of the node in it),
+            None if the node is not laid out.
+        """
+        layout = self._ensureLayout()
+        if layout is None:
+            return None
+        return layout.findNode(node)
+
     def keyReleaseEvent(self, event):
         #event.Skip()
-        if not self._selectedNode or not self.hot_map:
+        if self._selectedNode is None or not self.hot_map:
             return
 
         if event.key() == QtCore.Qt.Key.Key_Home.value:
             self.setSelectedNode(HotMapNavigator.firstNode(self.hot_map))
             return
-        elif event.key == QtCore.Qt.Key.Key_End.value:
+        elif event.key() == QtCore.Qt.Key.Key_End.value:
             self.setSelectedNode(HotMapNavigator.lastNode(self.hot_map))
             return
 
         try:
-            parent, children, index = HotMapNavigator.findNode(
-                self.hot_map, self._selectedNode
-            )
+            parent, children, index = self.findNode(self._selectedNode)
         except TypeError:
             log.info('Unable to find hot-map record for node %s', self._selectedNode)
         else:
@@ -156,10 +348,10 @@ class QSquareMap(QtWidgets.QWidget):
                 self.setSelectedNode(HotMapNavigator.previousChild(children, index))
             elif event.key() == QtCore.Qt.Key.Key_Right.value:
                 self.setSelectedNode(HotMapNavigator.firstChild(children, index))
-            elif event.key() == QtCore.Qt.Key.Key_Left.value and parent:
+            elif event.key() == QtCore.Qt.Key.Key_Left.value and parent is not None:
                 self.setSelectedNode(parent)
             elif event.key() == QtCore.Qt.Key.Key_Return.value:
-                self.setActiveNode(self._selectedNode, map=self)
+                self.setActiveNode(self._selectedNode)
 
 
     def activeNode(self):
@@ -191,7 +383,7 @@ class QSquareMap(QtWidgets.QWidget):
             return
         self._activeNode = node
         self.update()
-        if node and propagate:
+        if node is not None and propagate:
             self.activateNode.emit(node, point, self)
 
 
@@ -203,9 +395,9 @@ class QSquareMap(QtWidgets.QWidget):
         """Set the given node selected in the square-map"""
         if node == self._selectedNode:
             return
+        self._updateNodes(self._selectedNode, node)
         self._selectedNode = node
-        self.update()
-        if node and propagate:
+        if node is not None and propagate:
             self.selectNode.emit(node, point, self)
 
 
@@ -217,112 +409,691 @@ class QSquareMap(QtWidgets.QWidget):
         """Set the currently-highlighted node"""
         if node == self._highlightedNode:
             return
+        self._updateNodes(self._highlightedNode, node)
         self._highlightedNode = node
-        # TODO: restrict refresh to the squares for previous node and new node...
-        self.update()
-        if node and propagate:
+        if node is not None and propagate:
             self.highlightNode.emit(node, point, self)
 
+    def updateNodeValue(self, node, value, propagate=True):
+        """Change the value of the node, updating only the affected part of the map
+
+        propagate -- add the change to the values of the ancestors of the node as
+        well, for models whose values are the totals of their children
+        """
+        self._updateNode(node, value, propagate)
+
+    def replaceChildren(self, node, children, value=None, propagate=True):
+        """Replace the children of the node, updating only the affected part of the map
+
+        value -- if provided, the new value of the node, see updateNodeValue
+
+        The adapter stores the children (see DefaultAdapter.set_children);
+        ArrayTree models can not replace children, ArrayAdapter raises TypeError.
+        """
+        complete_adapter(self.adapter).set_children(node, children)
+        if self._parent_map is not None:
+            for child in children:
+                self._parent_map[child] = node
+        self._updateNode(node, value, propagate)
+
+    def _updateNode(self, node, value, propagate):
+        adapter = complete_adapter(self.adapter)
+        ancestors = self._ancestors(node)
+        if ancestors is None:
+            log.warning('%r is not in the model, laying the whole map out again', node)
+            if value is not None:
+                adapter.set_value(node, value)
+            adapter.invalidate(node)
+            self.layout_cache.clear()
+            self._label_cache.labels.clear()
+            self._invalidateLayout()
+            return
+        if value is not None:
+            if propagate:
+                delta = value - adapter.value(node)
+                for parent in ancestors:
+                    adapter.set_value(parent, adapter.value(parent) + delta)
+            adapter.set_value(node, value)
+        adapter.invalidate(node)
+        # labels may show the values
+        self._label_cache.forget([node] + ancestors)
+        # other roots and sizes would have to be laid out again as well
+        self.layout_cache.clear()
+        layout = self._layout
+        if layout is None or self._refinement is not None:
+            self._invalidateLayout()
+            return
+        # the nearest node still laid out
+        for target in [node] + ancestors:
+            if layout.box(target) is not None:
+                break
+        else:
+            # unknown ancestors
+            self._invalidateLayout()
+            return
+        dirty = self.layoutEngine().relayout(layout, target)
+        self.max_depth_seen = layout.max_depth_seen
+        self._cacheLayout(layout)
+        if not dirty.isEmpty():
+            self._renderRegion(dirty)
+
+    def _ancestors(self, node):
+        """Return the parent, grand-parent... of the node up to the model, None if unknown
+
+        The boxes of the layout give the ancestors up to the zoomed in root,
+        the adapter's parents or a walk of the model those above it.
+        """
+        ancestors = []
+        box = None if self._layout is None else self._layout.box(node)
+        if box is not None:
+            while box.parent is not None:
+                box = box.parent
+                ancestors.append(box.node)
+            node = box.node
+        if node == self.model:
+            return ancestors
+        parents = list(self.adapter.parents(node))
+        if not parents:
+            parents = self._modelParents(node)
+            if parents is None:
+                return None
+        return ancestors + parents
+
+    def _modelParents(self, node):
+        """Return the ancestors of the node from the parent map of the model, None if not in it"""
+        parent_map = self._parent_map
+        if parent_map is None:
+            parent_map = self._parent_map = {}
+            stack = [self.model]
+            while stack:
+                parent = stack.pop()
+                for child in self.adapter.children(parent) or ():
+                    parent_map[child] = parent
+                    stack.append(child)
+        if node not in parent_map:
+            return None
+        parents = []
+        while node in parent_map:
+            node = parent_map[node]
+            parents.append(node)
+        return parents
+
+    def _renderRegion(self, rect):
+        """Render the rect part of the backing store again and repaint it"""
+        rect = QtCore.QRectF(*rect).toAlignedRect()
+        pixmap = self._backing_store
+        if pixmap is not None:
+            painter = QtGui.QPainter(pixmap)
+            try:
+                painter.setClipRect(rect)
+                painter.setCompositionMode(QtGui.QPainter.CompositionMode.CompositionMode_Source)
+                painter.fillRect(rect, QtCore.Qt.GlobalColor.transparent)
+                painter.setCompositionMode(QtGui.QPainter.CompositionMode.CompositionMode_SourceOver)
+                self.renderer().render(painter, self._layout.boxes(QtCore.QRectF(rect)))
+            finally:
+                painter.end()
+        self.update(rect)
+
+    def rootNode(self):
+        """Return the node shown at the root of the map: the model, or the node zoomed into"""
+        return self._zoom_history[-1] if self._zoom_history else self.model
+
+    def zoomHistory(self):
+        """Return the nodes zoomed into, the current root last"""
+        return list(self._zoom_history)
+
+    def zoomIn(self, node):
+        """Show the node at the root of the map, zoomOut goes back
+
+        Zooming into a node of the zoom history goes back to it.
+        """
+        if node is None or node == self.rootNode():
+            return
+        if node == self.model:
+            del self._zoom_history[:]
+        elif node in self._zoom_history:
+            del self._zoom_history[self._zoom_history.index(node) + 1:]
+        else:
+            self._zoom_history.append(node)
+        self._zoomChanged()
+
+    def zoomOut(self):
+        """Go back to the root shown before the last zoomIn, return the new root"""
+        if self._zoom_history:
+            self._zoom_history.pop()
+            self._zoomChanged()
+        return self.rootNode()
+
+    def zoomReset(self):
+        """Show the whole model again"""
+        if self._zoom_history:
+            del self._zoom_history[:]
+            self._zoomChanged()
+
+    def _zoomChanged(self):
+        self._keepPreviousLayout()
+        self._invalidateLayout()
+        self.zoomNode.emit(self.rootNode(), self)
+
+    def _modelChanged(self):
+        self._keepPreviousLayout()
+        del self._zoom_history[:]
+        self._parent_map = None
+        self.layout_cache.clear()
+        self._label_cache.clear()
+        self._invalidateLayout()
+
+    def _keepPreviousLayout(self):
+        """Keep the current layout to animate the next one from"""
+        if self.animate and self._layout is not None:
+            self._previous_layout = self._layout
+
+    def _startTransition(self, layout):
+        previous, self._previous_layout = self._previous_layout, None
+        self._transition = LayoutTransition(previous, layout, self.adapter)
+        self._transition_progress = 0.0
+        self._animation.stop()
+        self._animation.setDuration(self.animation_duration)
+        self._animation.start()
+
+    def _animationStep(self, progress):
+        self._transition_progress = progress
+        self.update()
+
+    def _animationFinished(self):
+        self._transition = None
+        self.update()
+
     def SetModel(self, model, adapter=None):
         """Set our model object (root of the tree)"""
         self.model = model
         if adapter is not None:
             self.adapter = adapter
+
+    def _updateNodes(self, *nodes):
+        """Schedule a repaint of the squares of the given nodes only"""
+        if self._layout is None:
+            self.update()
+            return
+        for node in nodes:
+            box = self._layout.box(node)
+            if box is not None:
+                self.update(QtCore.QRectF(*box.rect).toAlignedRect())
+
+    def resizeEvent(self, event):
+        """The layout depends on the widget size"""
+        self._invalidateLayout()
+        super(QSquareMap, self).resizeEvent(event)
+
+    def changeEvent(self, event):
+        """Palette changes may change the colors of the map"""
+        if event.type() in (
+            QtCore.QEvent.Type.PaletteChange,
+            QtCore.QEvent.Type.ApplicationPaletteChange,
+            QtCore.QEvent.Type.FontChange,
+            QtCore.QEvent.Type.ApplicationFontChange,
+        ):
+            self.refreshColors()
+        super(QSquareMap, self).changeEvent(event)
+
+    def refreshColors(self):
+        """Re-render the map after the adapter's colors, fonts or labels changed"""
+        clear_color_cache = getattr(self.adapter, 'clear_color_cache', None)
+        if clear_color_cache is not None:
+            clear_color_cache()
+        self._label_cache.clear()
+        self._invalidateBackingStore()
+
+    def _invalidateLayout(self):
+        """Drop the cached layout, it is recomputed on the next paint"""
+        self._layout = None
+        if self._transition is not None:
+            self._animation.stop()
+            self._transition = None
+        if self._refinement is not None:
+            self._refine_timer.stop()
+            self._refinement = None
+        if self._layout_task is not None:
+            self._layout_task.cancel()
+            self._layout_task = None
+        self._invalidateBackingStore()
+
+    def _invalidateBackingStore(self):
+        """Drop the rendered map, it is rendered again on the next paint"""
+        if self._backing_store is not None:
+            # shown until the new one is available
+            self._stale_backing_store = self._backing_store
+        self._backing_store = None
         self.update()
 
+    def layoutEngine(self):
+        """Return a LayoutEngine configured like this square-map"""
+        return LayoutEngine(
+            self.adapter,
+            padding=self.padding,
+            margin=self.margin,
+            square_style=self.square_style,
+            max_depth=self.max_depth,
+            squarified=self.squarified,
+            min_area=self.min_area,
+            ordered=self.ordered,
+        )
+
+    def _ensureLayout(self):
+        """Return the current layout, running a layout pass if needed
+
+        When the layout is computed in the background, None is returned until
+        it is available.
+        """
+        if self._layout is None and self._layout_task is None:
+            root = self.rootNode()
+            if root is None:
+                self.hot_map = []
+                self._stale_backing_store = None
+            elif self.layout_cache.get(self._layoutKey()) is not None:
+                self._setLayout(self.layout_cache.get(self._layoutKey()))
+            elif self.progressive:
+                self._refinement = self.layoutEngine()
+                self._setLayout(
+                    self._refinement.beginLayout(root, QtCore.QRectF(self.rect()))
+                )
+                self._refine_timer.start(0)
+            elif self.background_layout and getattr(self.adapter, 'thread_safe', False):
+                self._layout_task = LayoutTask(
+                    self.layoutEngine(), root, QtCore.QRectF(self.rect())
+                )
+                self._layout_task.finished.connect(self._layoutFinished)
+                QtCore.QThreadPool.globalInstance().start(self._layout_task)
+            else:
+                layout = self.layoutEngine().layout(root, QtCore.QRectF(self.rect()))
+                self._setLayout(layout)
+                self._cacheLayout(layout)
+        return self._layout
+
+    def _layoutKey(self):
+        """Identify the layout of the current root, size and options in the layout_cache"""
+        return (
+            self.rootNode(),
+            self.width(),
+            self.height(),
+            self.padding,
+            self.margin,
+            self.square_style,
+            self.squarified,
+            self.min_area,
+            self.max_depth,
+            self.ordered,
+        )
+
+    def _cacheLayout(self, layout):
+        self.layout_cache.put(self._layoutKey(), layout)
+
+    def _layoutFinished(self, task, layout):
+        """Take the layout computed by a background LayoutTask"""
+        if task is not self._layout_task:
+            return  # cancelled meanwhile
+        self._layout_task = None
+        self._setLayout(layout)
+        self._cacheLayout(layout)
+        self.update()
+
+    def _refineLayout(self):
+        """Lay out and paint the next slice of a progressive layout"""
+        engine, layout = self._refinement, self._layout
+        if engine is None or layout is None:
+            return
+        boxes = engine.refine(layout, self.frame_budget)
+        self.max_depth_seen = layout.max_depth_seen
+        if self._backing_store is not None and boxes:
+            # children are drawn over their parents, like a full render does
+            painter = QtGui.QPainter(self._backing_store)
+            try:
+                self.renderer().render(painter, boxes)
+            finally:
+                painter.end()
+        if boxes:
+            region = Rect()
+            for box in boxes:
+                region = region.united(box.rect)
+            self.update(QtCore.QRectF(*region).toAlignedRect())
+        if engine.complete:
+            self._refinement = None
+            self._cacheLayout(layout)
+        else:
+            self._refine_timer.start(0)
+
+    def _setLayout(self, layout):
+        if self._previous_layout is not None and self._refinement is None:
+            self._startTransition(layout)
+        self._layout = layout
+        self.hot_map = layout.hot_map
+        self.max_depth_seen = layout.max_depth_seen
+
+    def _ensureBackingStore(self, layout):
+        """Return the map rendered without highlight and selection"""
+        ratio = self.devicePixelRatioF()
+        pixmap = self._backing_store
+        if pixmap is None or pixmap.devicePixelRatio() != ratio:
+            size = self.size() * ratio
+            if (
+                self.tiled_threshold is not None
+                and size.width() * size.height() >= self.tiled_threshold
+                and getattr(self.adapter, 'thread_safe_rendering', False)
+            ):
+                pixmap = QtGui.QPixmap.fromImage(
+                    TiledRenderer(self.adapter, labels=self.labels).render(layout, ratio)
+                )
+            else:
+                pixmap = QtGui.QPixmap(size)
+                pixmap.setDevicePixelRatio(ratio)
+                pixmap.fill(QtCore.Qt.GlobalColor.transparent)
+                painter = QtGui.QPainter(pixmap)
+                try:
+                    self.renderer().render(painter, layout.boxes())
+                finally:
+                    painter.end()
+            self._backing_store = pixmap
+            self._stale_backing_store = None
+        return pixmap
+
+    def renderer(self):
+        """Return a LayoutRenderer painting with our adapter and options"""
+        return LayoutRenderer(
+            self.adapter, labels=self.labels, label_cache=self._label_cache
+        )
+
     def paintEvent(self, event):
         """
         Draw the tree map on the device context.
+
+        The map itself comes from the backing store, only the boxes of the
+        selected and highlighted nodes (and their children) are drawn over it.
+        Both are restricted to the dirty rectangle of the event, the layout
+        itself always covers the whole widget.
         """
-        self.painter = QtGui.QPainter(self)
-        self.painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
-        self.hot_map = []
-        brush = QtGui.QBrush(self.BackgroundColour)
-        self.painter.setBackground(brush)
-        if self.model:
-            self.max_depth_seen = 0
-            font = self.adapter.font_for_labels(self.painter)
-            self.painter.setFont(font)
-            self._em_size_ = QtGui.QFontMetrics(font).averageCharWidth()
-            rect = QtCore.QRectF(event.rect())
-            self.DrawBox(self.model, rect, hot_map=self.hot_map)
-        self.painter.end()
-
-    def DrawBox(self, node, rect, hot_map, depth=0):
-        """Draw a model-node's box and all children nodes"""
-        log.debug(
-            'Draw: %s to (%s,%s,%s,%s) depth=%s',
-            node, rect, depth
+        layout = self._ensureLayout()
+        painter = QtGui.QPainter(self)
+        try:
+            brush = QtGui.QBrush(self.BackgroundColour)
+            painter.setBackground(brush)
+            dirty = QtCore.QRectF(event.rect())
+            painter.setClipRegion(event.region())
+            if self._transition is not None:
+                # box fills only, the labels come with the final frame
+                self._transition.draw(painter, self._transition_progress)
+            elif layout is None:
+                if self._stale_backing_store is not None:
+                    # the layout is computed in the background, keep the previous frame
+                    self._drawPixmap(painter, self._stale_backing_store, dirty)
+            else:
+                self._drawPixmap(painter, self._ensureBackingStore(layout), dirty)
+                overlay = [
+                    box for box in (
+                        layout.box(self._selectedNode),
+                        layout.box(self._highlightedNode),
+                    ) if box is not None
+                ]
+                if overlay:
+                    self.renderer().render(
+                        painter,
+                        walk_boxes(overlay, dirty),
+                        selected=self._selectedNode,
+                        highlighted=self._highlightedNode,
+                    )
+        finally:
+            painter.end()
+
+    @staticmethod
+    def _drawPixmap(painter, pixmap, rect):
+        """Draw the rect part of the device pixel ratio aware pixmap"""
+        ratio = pixmap.devicePixelRatio()
+        painter.drawPixmap(
+            rect,
+            pixmap,
+            QtCore.QRectF(
+                rect.x() * ratio,
+                rect.y() * ratio,
+                rect.width() * ratio,
+                rect.height() * ratio,
+            ),
         )
-        if self.max_depth and depth > self.max_depth:
-            return
-        self.max_depth_seen = max((self.max_depth_seen, depth))
-        self.painter.setBrush(self.adapter.brush_for_node(node, depth, node==self._selectedNode, node==self._highlightedNode))
-        self.painter.setPen(self.adapter.pen_for_node(node, depth, node==self._selectedNode))
-        # drawing offset by margin within the square...
-        drect = rect.adjusted(self.margin, self.margin, -self.margin, -self.margin)
-        if sys.platform == 'darwin':
-            # Macs don't like drawing small rounded rects...
-            if rect.width() < self.padding * 2 or rect.height() < self.padding * 2:
-                self.painter.drawRect(drect)
+
+
+class LayoutTransition:
+    """Move the boxes of a layout from where their nodes were in a previous layout
+
+    Boxes are matched by node, the others grow out of their parent.  Only
+    the box fills are drawn, grouped by brush and pen, from rectangles
+    interpolated all at once (with NumPy when available).
+    """
+
+    def __init__(self, previous, layout, adapter):
+        start, end, starts = [], [], {}
+        groups = {}
+        for index, box in enumerate(layout.boxes()):
+            rect = tuple(box.drect)
+            old = previous.box(box.node)
+            if old is not None:
+                old = tuple(old.drect)
+            elif box.parent is not None:
+                old = starts[id(box.parent)]
             else:
-                self.painter.drawRoundedRect(drect, self.padding)
-        else:
-            # On modern machines, padding can be a *huge* number, far larger than
-            # the dw/dh, so this reduces radius on small boxes and switches to square
-            # boxes when extremely small
-            pad = self.padding * 3
-            if drect.width() <= pad * 2 or drect.height() <= pad * 2:
-                pad = min([drect.width() // 2, drect.height() // 2])
-                if pad < 1:
-                    pad = 0
-            if pad:
-                self.painter.drawRoundedRect(drect, pad, pad)
+                old = rect
+            starts[id(box)] = old
+            start.append(old)
+            end.append(rect)
+            brush = adapter.brush_for_node(box.node, box.depth)
+            pen = adapter.pen_for_node(box.node, box.depth)
+            key = id(brush), id(pen)
+            if key not in groups:
+                groups[key] = brush, pen, []
+            groups[key][2].append(index)
+        self.numpy = numpy = vectorized.load_numpy()
+        if numpy is not None:
+            start, end = numpy.array(start, dtype=float), numpy.array(end, dtype=float)
+            groups = dict([
+                (key, (brush, pen, numpy.array(indices)))
+                for key, (brush, pen, indices) in groups.items()
+            ])
+        self.start = start
+        self.end = end
+        self.groups = list(groups.values())
+
+    def rects(self, progress):
+        """Return the (x, y, width, height) of the boxes at progress (0 to 1)"""
+        if self.numpy is not None:
+            return self.start + (self.end - self.start) * progress
+        return [
+            tuple([a + (b - a) * progress for a, b in zip(start, end)])
+            for start, end in zip(self.start, self.end)
+        ]
+
+    def draw(self, painter, progress):
+        rects = self.rects(progress)
+        for brush, pen, indices in self.groups:
+            painter.setBrush(brush)
+            painter.setPen(pen)
+            if self.numpy is not None:
+                group = rects[indices].tolist()
             else:
-                self.painter.drawRect(drect)
-                self.DrawIconAndLabel(node, rect, depth)
-        children_hot_map = []
-        hot_map.append(
-            (rect, node, children_hot_map)
-        )
+                group = [rects[index] for index in indices]
+            painter.drawRects([QtCore.QRectF(*rect) for rect in group])
 
-        rect = rect.adjusted(self.padding, self.padding, -self.padding, -self.padding)
 
-        empty = self.adapter.empty(node)
-        icon_drawn = False
-        if self.max_depth and depth == self.max_depth:
-            self.DrawIconAndLabel(node, rect, depth)
-            icon_drawn = True
-        elif empty:
-            # is a fraction of the space which is empty...
-            log.debug('  empty space fraction: %s', empty)
-            self.DrawIconAndLabel(node, rect.adjusted(0, 0, 0, (rect.height() * empty)), depth)
-            icon_drawn = True
-            rect.moveTop(rect.top() + rect.height() * empty)
-            rect.setHeiht(rect.height() * (1.0 - empty))
-
-        if rect.width() > self.padding * 2 and rect.height() > self.padding * 2:
-            children = self.adapter.children(node)
-            if children:
-                log.debug('  children: %s', children)
-                self.LayoutChildren(
-                    children, node, rect, children_hot_map, depth + 1
-                )
+class LabelCache:
+    """Labels of the nodes and their QStaticText, elided to the available width
+
+    A LabelCache is not thread safe, give each thread its own.
+    """
+
+    # prepared texts kept before starting over
+    limit = 100000
+
+    def __init__(self):
+        self.font = None
+        self.metrics = None
+        self.labels = {}
+        self.texts = {}
+
+    def setFont(self, font):
+        """Use font for the texts, the prepared texts are dropped if it changed"""
+        if self.font is None or font != self.font:
+            self.font = QtGui.QFont(font)
+            self.metrics = QtGui.QFontMetricsF(self.font)
+            self.texts.clear()
+
+    def clear(self):
+        self.labels.clear()
+        self.texts.clear()
+
+    def forget(self, nodes):
+        """Drop the labels of the nodes, whose data changed"""
+        for node in nodes:
+            self.labels.pop(node, None)
+
+    def text(self, label, width):
+        """Return the QStaticText of the label elided to width, None if none of it fits"""
+        key = label, int(width)
+        text = self.texts.get(key, False)
+        if text is False:
+            if len(self.texts) >= self.limit:
+                self.texts.clear()
+            elided = self.metrics.elidedText(
+                label, QtCore.Qt.TextElideMode.ElideRight, key[1]
+            )
+            if elided and elided != '\u2026':
+                text = QtGui.QStaticText(elided)
+                text.setTextFormat(QtCore.Qt.TextFormat.PlainText)
+                text.prepare(QtGui.QTransform(), self.font)
             else:
-                log.debug('  no children')
-                if not icon_drawn:
-                    self.DrawIconAndLabel(node, rect, depth)
+                text = None
+            self.texts[key] = text
+        return text
+
+
+class LayoutRenderer:
+    """Paint the boxes of a Layout with a QPainter"""
+
+    def __init__(self, adapter, labels=True, batched=True, label_cache=None):
+        """Initialise the LayoutRenderer
+
+        adapter -- a DefaultAdapter or same-interface instance providing colors and labels
+        labels -- set to True (default) to draw textual labels within the boxes
+        batched -- set to True (default) to draw boxes sharing brush and pen at once,
+        otherwise each box is drawn on its own
+        label_cache -- a LabelCache to share between renderers, by default the
+        renderer has its own
+        """
+        self.adapter = adapter
+        self.labels = labels
+        self.batched = batched
+        self.label_cache = LabelCache() if label_cache is None else label_cache
+        self.selected = None
+        self.highlighted = None
+
+    def render(self, painter, boxes, selected=None, highlighted=None):
+        """Paint the boxes, the selected and highlighted nodes get their own colors"""
+        self.painter = painter
+        self.selected = selected
+        self.highlighted = highlighted
+        painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+        font = self.adapter.font_for_labels(painter)
+        painter.setFont(font)
+        self.label_cache.setFont(font)
+        self._em_size_ = self.label_cache.metrics.averageCharWidth()
+        self._line_height = self.label_cache.metrics.height()
+        self._label_color = None
+        if self.batched:
+            self.DrawBatched(boxes)
+        else:
+            for box in boxes:
+                self.DrawBox(box)
+
+    def DrawBatched(self, boxes):
+        """Draw the boxes depth by depth, grouped by brush and pen
+
+        Boxes of the same depth do not overlap, so each depth is drawn with
+        one drawRects (square boxes) and the rounded boxes per brush and pen,
+        followed by its labels, before the deeper boxes.
+        """
+        levels = []
+        for box in boxes:
+            while len(levels) <= box.depth:
+                levels.append([])
+            levels[box.depth].append(box)
+        adapter = self.adapter
+        for level in levels:
+            groups = {}
+            for box in level:
+                node, depth = box.node, box.depth
+                selected = node == self.selected
+                brush = adapter.brush_for_node(node, depth, selected, node == self.highlighted)
+                pen = adapter.pen_for_node(node, depth, selected)
+                # the group holds brush and pen, so their ids stay unique meanwhile
+                group = groups.get((id(brush), id(pen)))
+                if group is None:
+                    group = groups[(id(brush), id(pen))] = (brush, pen, [], [])
+                if box.radius:
+                    group[3].append(box)
+                else:
+                    group[2].append(QtCore.QRectF(*box.drect))
+            for brush, pen, rects, rounded in groups.values():
+                self.painter.setBrush(brush)
+                self.painter.setPen(pen)
+                if rects:
+                    self.painter.drawRects(rects)
+                # one path of many rounded rectangles fills far slower than
+                # drawing them one by one
+                for box in rounded:
+                    self.painter.drawRoundedRect(
+                        QtCore.QRectF(*box.drect), box.radius, box.radius
+                    )
+            self._label_color = None
+            for box in level:
+                for rect in box.labels:
+                    self.DrawIconAndLabel(box.node, rect, box.depth)
+
+    def DrawBox(self, box):
+        """Draw a laid out model-node's box and its label"""
+        node, depth = box.node, box.depth
+        selected = node == self.selected
+        self.painter.setBrush(self.adapter.brush_for_node(node, depth, selected, node==self.highlighted))
+        self.painter.setPen(self.adapter.pen_for_node(node, depth, selected))
+        if box.radius:
+            self.painter.drawRoundedRect(QtCore.QRectF(*box.drect), box.radius, box.radius)
         else:
-            log.debug('  not enough space: children skipped')
+            self.painter.drawRect(QtCore.QRectF(*box.drect))
+        self._label_color = None
+        for rect in box.labels:
+            self.DrawIconAndLabel(node, rect, depth)
+
+    def label(self, node):
+        """Return the label of the node"""
+        if isinstance(node, AggregateNode):
+            return node.name
+        labels = self.label_cache.labels
+        label = labels.get(node)
+        if label is None:
+            label = labels[node] = self.adapter.label(node)
+        return label
 
     def DrawIconAndLabel(self, node, rect, depth):
-        '''Draw the icon, if any, and the label, if any, of the node.'''
-        if rect.width() - 2 < self._em_size_ // 2 or rect.height() - 2 < self._em_size_ // 2:
+        '''Draw the icon, if any, and the label, if any, of the node.
+
+        The label is elided to the width of the box and left out when it is not
+        high enough for it, so that nothing needs to be clipped.
+        '''
+        # the label goes 2 pixels right and 20 down of the top left corner, and
+        # keeps off the last pixel of the box
+        if not self.labels or rect.height() - 21 < self._line_height:
             return
-        self.painter.setClipRect(rect.adjusted(1, 1, -1, -1))  # Don't draw outside the box
-        try:
+        width = rect.width() - 3
+        if width < self._em_size_:
+            return
+        text = self.label_cache.text(self.label(node), width)
+        if text is not None:
             # TODO: draw icons
-            #icon = self.adapter.icon(node, node == self._selectedNode)
+            #icon = self.adapter.icon(node, node == self.selected)
             #available_sizes = icon.availableSizes(QtGui.QIcon.Mode.Normal, QtGui.QIcon.State.On)
             #icon_size = icon.actualSize(rect, QtGui.QIcon.Mode.Normal, QtGui.QIcon.State.On)
             #if icon and rect.height() >= icon.GetHeight() and w >= icon.GetWidth():
@@ -333,160 +1104,122 @@ class QSquareMap(QtWidgets.QWidget):
             #else:
                 #iconWidth = 0
             iconWidth = 0
-            if self.labels and rect.height() >= self.painter.fontMetrics().height():
-                self.painter.setPen(self.adapter.color_for_label(node, depth, node == self._selectedNode))
-                self.painter.drawText(rect.adjusted(iconWidth + 2, 20, 0, 0), 0, self.adapter.label(node))
-        finally:
-            self.painter.setClipping(False)
+            color = self.adapter.color_for_label(node, depth, node == self.selected)
+            if color != self._label_color:
+                self.painter.setPen(color)
+                self._label_color = color
+            self.painter.drawStaticText(
+                QtCore.QPointF(rect.x() + iconWidth + 2, rect.y() + 20), text
+            )
 
-    def LayoutChildren(
-        self, children, parent, rect, hot_map, depth=0, node_sum=None
-    ):
-        """Layout the set of children in the given rectangle
 
-        node_sum -- if provided, we are a recursive call that already has sizes and sorting,
-            so skip those operations
-        """
-        if node_sum is None:
-            nodes = [(self.adapter.value(node, parent), node) for node in children]
-            nodes.sort(key=operator.itemgetter(0))
-            total = self.adapter.children_sum(children, parent)
-        else:
-            nodes = children
-            total = node_sum
-        if total:
-            if self.square_style and len(nodes) > 5:
-                # new handling to make parents with large numbers of parents a little less
-                # "sliced" looking (i.e. more square)
-                (head_sum, head), (tail_sum, tail) = split_by_value(total, nodes)
-                if head and tail:
-                    # split into two sub-boxes and render each...
-                    head_coord, tail_coord = split_box(
-                        head_sum / float(total), rect
-                    )
-                    if head_coord:
-                        self.LayoutChildren(
-                            head,
-                            parent,
-                            head_coord,
-                            hot_map,
-                            depth,
-                            node_sum=head_sum,
-                        )
-                    if tail_coord and coord_bigger_than_padding(
-                        tail_coord, self.padding + self.margin
-                    ):
-                        self.LayoutChildren(
-                            tail,
-                            parent,
-                            tail_coord,
-                            hot_map,
-                            depth,
-                            node_sum=tail_sum,
-                        )
-                    return
-
-            (firstSize, firstNode) = nodes[-1]
-            fraction = firstSize / float(total)
-            head_coord, tail_coord = split_box(fraction, rect)
-            if head_coord:
-                self.DrawBox(
-                    firstNode,
-                    head_coord,
-                    hot_map,
-                    depth,
-                )
-            else:
-                return  # no other node will show up as non-0 either
+class TiledRenderer:
+    """Render a Layout into QImages tile by tile, on several threads
 
-            if (
-                len(nodes) > 1
-                and tail_coord
-                and coord_bigger_than_padding(tail_coord, self.padding + self.margin)
-            ):
-                self.LayoutChildren(
-                    nodes[:-1],
-                    parent,
-                    tail_coord,
-                    hot_map,
-                    depth,
-                    node_sum=total - firstSize,
-                )
+    Each tile is painted into its own QImage, clipped to the tile and from
+    the boxes intersecting it only.  Each thread has its own LayoutRenderer
+    and so its own label cache; the adapter's color and label methods are
+    called from the worker threads (see DefaultAdapter.thread_safe_rendering).
+    """
 
+    def __init__(self, adapter, labels=True, tile_size=512, threads=None):
+        """Initialise the TiledRenderer
 
-def coord_bigger_than_padding(tail_coord, padding):
-    return tail_coord and tail_coord.width() > padding * 2 and tail_coord.height() > padding * 2
+        adapter -- a DefaultAdapter or same-interface instance providing colors and labels
+        labels -- set to True (default) to draw textual labels within the boxes
+        tile_size -- width and height of the tiles, in device pixels
+        threads -- number of worker threads, defaults to the number of CPUs
+        """
+        self.adapter = adapter
+        self.labels = labels
+        self.tile_size = tile_size
+        self.threads = threads or os.cpu_count() or 1
+        self._local = threading.local()
+
+    def renderer(self):
+        """Return the LayoutRenderer of the current thread"""
+        renderer = getattr(self._local, 'renderer', None)
+        if renderer is None:
+            renderer = self._local.renderer = LayoutRenderer(self.adapter, labels=self.labels)
+        return renderer
+
+    def tiles(self, width, height):
+        """Return the QRects of the tiles covering width x height pixels, row by row"""
+        size = self.tile_size
+        return [
+            QtCore.QRect(x, y, min(size, width - x), min(size, height - y))
+            for y in range(0, height, size)
+            for x in range(0, width, size)
+        ]
+
+    def imageSize(self, layout, ratio=1.0):
+        """Return the width and height in pixels of the layout rendered at ratio"""
+        rect = layout.rect
+        return int(math.ceil(rect.right() * ratio)), int(math.ceil(rect.bottom() * ratio))
+
+    def renderTile(self, layout, tile, ratio=1.0):
+        """Return a QImage of the tile, in pixels of the layout rendered at ratio"""
+        image = QtGui.QImage(
+            tile.width(), tile.height(), QtGui.QImage.Format.Format_ARGB32_Premultiplied
+        )
+        image.fill(QtCore.Qt.GlobalColor.transparent)
+        area = QtCore.QRectF(
+            tile.x() / ratio, tile.y() / ratio, tile.width() / ratio, tile.height() / ratio
+        )
+        painter = QtGui.QPainter(image)
+        try:
+            painter.translate(-tile.x(), -tile.y())
+            painter.scale(ratio, ratio)
+            painter.setClipRect(area)
+            self.renderer().render(painter, layout.boxes(area))
+        finally:
+            painter.end()
+        return image
 
+    def renderTiles(self, layout, tiles, ratio=1.0):
+        """Render the tiles in parallel, yield (tile, QImage) in the order of tiles
+
+        At most twice as many tiles as there are threads are held in memory.
+        """
+        tiles = list(tiles)
+        if not tiles:
+            return
+        # the first tile on this thread: fills the adapter's color caches
+        # before the workers use them
+        yield tiles[0], self.renderTile(layout, tiles[0], ratio)
+        pending = deque()
+        with futures.ThreadPoolExecutor(self.threads) as pool:
+            for tile in tiles[1:]:
+                pending.append((tile, pool.submit(self.renderTile, layout, tile, ratio)))
+                if len(pending) >= 2 * self.threads:
+                    tile, future = pending.popleft()
+                    yield tile, future.result()
+            while pending:
+                tile, future = pending.popleft()
+                yield tile, future.result()
+
+    def render(self, layout, ratio=1.0):
+        """Return a QImage of the whole layout, with a device pixel ratio of ratio"""
+        width, height = self.imageSize(layout, ratio)
+        image = QtGui.QImage(width, height, QtGui.QImage.Format.Format_ARGB32_Premultiplied)
+        image.fill(QtCore.Qt.GlobalColor.transparent)
+        painter = QtGui.QPainter(image)
+        try:
+            for tile, tile_image in self.renderTiles(layout, self.tiles(width, height), ratio):
+                painter.drawImage(tile.topLeft(), tile_image)
+        finally:
+            painter.end()
+        image.setDevicePixelRatio(ratio)
+        return image
 
-def split_box(fraction, rect):
-    """
-    Return set of two boxes where first is the fraction given
-    """
-    head, tail = None, None
-    w, h = rect.width(), rect.height()
-
-    if w >= h:
-        head_w = w * fraction
-        if head_w:
-            head = rect.adjusted(0, 0, -(w - head_w), 0)
-            tail = rect.adjusted(head_w, 0, 0, 0)
-    else:
-        head_h = h * fraction
-        if head_h:
-            head = rect.adjusted(0, 0, 0, -(h - head_h))
-            tail = rect.adjusted(0, head_h, 0, 0)
-
-    return head, tail
-
-
-def split_by_value(total, nodes, headdivisor=2.0):
-    """Produce, (sum,head),(sum,tail) for nodes to attempt binary partition"""
-    head_sum = 0
-    divider = 0
-    for node in nodes[::-1]:
-        if head_sum < total / headdivisor:
-            head_sum += node[0]
-            divider -= 1
-        else:
-            break
-    return (head_sum, nodes[divider:]), (total - head_sum, nodes[:divider])
 
 
-class DefaultAdapter:
+class DefaultAdapter(NodeAdapter):
     """Default adapter class for adapting node-trees to QSquareMap API"""
 
     DEFAULT_PEN = QtGui.QPen(QtCore.Qt.GlobalColor.black)
     SELECTED_PEN = QtGui.QPen(QtCore.Qt.GlobalColor.white)
 
-    def children(self, node):
-        """Retrieve the set of nodes which are children of this node"""
-        return node.children
-
-    def value(self, node, parent=None):
-        """Return value used to compare nodes"""
-        return node.value
-
-    def label(self, node):
-        """Return textual description of this node"""
-        return str(node.name)
-
-    def overall(self, node):
-        """Calculate overall value of the node including children and empty space"""
-        return sum([self.value(value, node) for value in self.children(node)])
-
-    def children_sum(self, children, node):
-        """Calculate children's total sum"""
-        return sum([self.value(value, node) for value in children])
-
-    def empty(self, node):
-        """Calculate empty space as a fraction of total space"""
-        overall = self.overall(node)
-        if overall:
-            return (overall - self.children_sum(self.children(node), node)) / float(
-                overall
-            )
-        return 0
-
     def background_color(self, node, depth):
         '''The color to use as background color of the node.'''
         return None
@@ -496,7 +1229,30 @@ class DefaultAdapter:
         return None
 
     def brush_for_node(self, node, depth=0, selected=False, highlighted=False):
-        """Create brush to use to display the given node"""
+        """Create brush to use to display the given node
+
+        Brushes are cached: per (depth, selected, highlighted) when the colors
+        are cacheable, otherwise per color returned by background_color.
+        """
+        cache = self.color_cache()
+        if selected or highlighted:
+            key = ('brush', None, bool(selected), bool(highlighted))
+            color = None
+        elif self.cacheable_colors():
+            key = ('brush', depth, False, False)
+            color = None
+        else:
+            color = self.background_color(node, depth)
+            key = ('brush', color.rgba()) if color else ('brush', depth, False, False)
+        brush = cache.get(key)
+        if brush is None:
+            if not color:
+                color = self.node_color(node, depth, selected, highlighted)
+            brush = cache[key] = QtGui.QBrush(color)
+        return brush
+
+    def node_color(self, node, depth=0, selected=False, highlighted=False):
+        """Determine the fill color of the given node"""
         if selected:
             color = QtGui.QColor(255, 0, 0)
         elif highlighted:
@@ -508,7 +1264,7 @@ class DefaultAdapter:
                 green = 255 - ((depth * 5) % 255)
                 blue = (depth * 25) % 255
                 color = QtGui.QColor(red, green, blue)
-        return QtGui.QBrush(color)
+        return color
 
     def pen_for_node(self, node, depth=0, selected=False, highlighted=False):
         """Determine the pen to use to display the given node"""
@@ -524,35 +1280,246 @@ class DefaultAdapter:
     def color_for_label(self, node, depth=0, selected=False):
         """Determine the text foreground color to use to display the label of
         the given node"""
+        cache = self.color_cache()
         if selected:
-            fg_color = QtWidgets.QApplication.palette().highlightedText()
+            key = ('label', True)
+        elif self.cacheable_colors():
+            key = ('label', depth)
         else:
             fg_color = self.foreground_color(node, depth)
-            if not fg_color:
-                fg_color = QtWidgets.QApplication.palette().text()
-        return fg_color.color()
+            if fg_color:
+                return fg_color.color()
+            key = ('label', False)
+        color = cache.get(key)
+        if color is None:
+            if selected:
+                fg_color = QtWidgets.QApplication.palette().highlightedText()
+            else:
+                fg_color = self.foreground_color(node, depth)
+                if not fg_color:
+                    fg_color = QtWidgets.QApplication.palette().text()
+            color = cache[key] = fg_color.color()
+        return color
+
+    # Whether background_color and foreground_color depend on the depth only,
+    # so that brushes and label colors can be cached per depth instead of being
+    # asked for every node.  None means only if they are not overridden.
+    colors_cacheable = None
+
+    # Whether the methods used for painting (brush_for_node, pen_for_node,
+    # color_for_label, font_for_labels and label) may be called from worker
+    # threads, allowing QSquareMap to render big maps with a TiledRenderer.
+    thread_safe_rendering = False
+
+    def cacheable_colors(self):
+        """Whether the colors only depend on the depth (see colors_cacheable)"""
+        cacheable = self.colors_cacheable
+        if cacheable is None:
+            class_ = type(self)
+            cacheable = (
+                class_.background_color is DefaultAdapter.background_color
+                and class_.foreground_color is DefaultAdapter.foreground_color
+            )
+        return cacheable
+
+    def color_cache(self):
+        """Return the cache of brushes and colors"""
+        try:
+            return self._color_cache
+        except AttributeError:
+            self._color_cache = {}
+            return self._color_cache
+
+    def clear_color_cache(self):
+        """Forget cached brushes and colors, e.g. after the palette changed"""
+        self._color_cache = {}
 
     def icon(self, node, isSelected):
         '''The icon to display in the node.'''
         return None
 
-    def parents(self, node):
-        """Retrieve/calculate the set of parents for the given node"""
-        return []
 
+class _Aggregates:
+    """Memoized per-node results of CachingAdapter"""
 
-class Node:
-    """Really dumb file-system node object"""
+    __slots__ = ('children', 'values', 'sum', 'empty', 'size', 'sorted', 'ordered')
 
-    def __init__(self, name, value, children):
-        self.name = name
-        self.value = value
+    def __init__(self, adapter, node, children):
         self.children = children
+        self.values = values = adapter.children_values(children, node)
+        # derived from the values, unless the adapter computes them its own way
+        if not overrides(adapter, 'children_sum'):
+            self.sum = sum(values)
+        else:
+            self.sum = adapter.children_sum(children, node)
+        if overrides(adapter, 'empty'):
+            self.empty = adapter.empty(node)
+        elif adapter.overall_sums_children():
+            self.empty = 0
+        else:
+            overall = adapter.overall(node)
+            self.empty = (overall - self.sum) / float(overall) if overall else 0
+        self.size = None
+        self.sorted = None
+        self.ordered = None
+
+
+class CachingAdapter:
+    """Adapter wrapper memoizing children, their values, sums and sort order
+
+    Everything else is delegated to the wrapped adapter.  Aggregates are
+    computed per node on first use, or for a whole tree at once by
+    prepare().  When the data of a node changes call invalidate(node):
+    the aggregates of the node and of all its ancestors are dropped.
+    """
+
+    def __init__(self, adapter=None):
+        self.adapter = DefaultAdapter() if adapter is None else complete_adapter(adapter)
+        self._aggregates = {}
+        self._parents = {}
+
+    def __getattr__(self, name):
+        return getattr(self.adapter, name)
+
+    def prepare(self, root):
+        """Compute the aggregates of all nodes of the tree in one post-order pass"""
+        stack = [(root, None)]
+        while stack:
+            node, children = stack.pop()
+            if children is None:
+                children = list(self.adapter.children(node) or ())
+                stack.append((node, children))
+                stack.extend([(child, None) for child in children])
+            else:
+                aggregates = self._aggregate(node, children)
+                aggregates.size = 1 + sum([
+                    self._aggregates[child].size for child in children
+                ])
+
+    def _aggregate(self, node, children):
+        aggregates = self._aggregates[node] = _Aggregates(self.adapter, node, children)
+        for child in children:
+            self._parents[child] = node
+        return aggregates
+
+    def aggregates(self, node):
+        """Return the memoized aggregates of the node, computing them if needed"""
+        aggregates = self._aggregates.get(node)
+        if aggregates is None:
+            aggregates = self._aggregate(
+                node, list(self.adapter.children(node) or ())
+            )
+        return aggregates
+
+    def invalidate(self, node):
+        """Forget the aggregates of the node and of all its ancestors"""
+        while node is not None:
+            self._aggregates.pop(node, None)
+            node = self._parents.get(node)
+
+    def clear(self):
+        """Forget all aggregates"""
+        self._aggregates.clear()
+        self._parents.clear()
+
+    def children(self, node):
+        return self.aggregates(node).children
+
+    def children_values(self, children, node):
+        return self.aggregates(node).values
+
+    def children_sum(self, children, node):
+        return self.aggregates(node).sum
+
+    def overall(self, node):
+        return self.adapter.overall(node)
+
+    def empty(self, node):
+        return self.aggregates(node).empty
+
+    def sorted_children(self, children, node):
+        aggregates = self.aggregates(node)
+        if aggregates.sorted is None:
+            aggregates.sorted = self.adapter.sorted_children(aggregates.children, node)
+        return aggregates.sorted
+
+    def ordered_children(self, children, node, key=None):
+        aggregates = self.aggregates(node)
+        if key is not None:
+            return self.adapter.ordered_children(aggregates.children, node, key)
+        if aggregates.ordered is None:
+            aggregates.ordered = self.adapter.ordered_children(aggregates.children, node)
+        return aggregates.ordered
+
+    def size(self, node):
+        """Return the number of nodes in the subtree of the node
+
+        Sizes are computed by prepare(), those missing (e.g. after invalidate())
+        from the sizes of the children.
+        """
+        stack = [(node, False)]
+        while stack:
+            current, ready = stack.pop()
+            aggregates = self.aggregates(current)
+            if aggregates.size is not None:
+                continue
+            if ready:
+                aggregates.size = 1 + sum([
+                    self._aggregates[child].size for child in aggregates.children
+                ])
+            else:
+                stack.append((current, True))
+                stack.extend([(child, False) for child in aggregates.children])
+        return self._aggregates[node].size
+
+
+class ArrayAdapter(DefaultAdapter):
+    """Adapter for the integer nodes of an ArrayTree
+
+    Children are ranges of node indices and children values are slices of
+    the tree's value array, so no per-node objects are involved.
+    """
+
+    thread_safe = True
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def children(self, node):
+        return self.tree.children(node)
+
+    def value(self, node, parent=None):
+        return self.tree.values[node]
+
+    def label(self, node):
+        return self.tree.label(node)
+
+    def children_values(self, children, node):
+        if isinstance(children, range) and children.step == 1:
+            return self.tree.values[children.start:children.stop]
+        return super(ArrayAdapter, self).children_values(children, node)
+
+    def children_sum(self, children, node):
+        return sum(self.children_values(children, node))
+
+    def set_value(self, node, value):
+        self.tree.values[node] = value
+
+    def set_children(self, node, children):
+        """The children of a node are a fixed range of the tree's arrays, so TypeError"""
+        raise TypeError('The children of ArrayTree nodes can not be replaced')
+
+    # overall is children_sum
+    overall_is_children_sum = True
+
+    def overall(self, node):
+        return self.children_sum(self.children(node), node)
+
+    def parents(self, node):
+        parents = []
+        parent = self.tree.parent(node)
+        while parent is not None:
+            parents.append(parent)
+            parent = self.tree.parent(parent)
+        return parents
 
-    def __repr__(self):
-        return '%s( %r, %r, %r )' % (
-            self.__class__.__name__,
-            self.name,
-            self.value,
-            self.children,
-        )
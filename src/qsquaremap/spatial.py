@@ -0,0 +1,60 @@
+"""Spatial index used to hit-test the boxes of a layout"""
+import math
+
+
+class RectIndex:
+    """Packed (Sort-Tile-Recursive) R-tree over a static set of rectangles
+
+    Rectangles are given as (left, top, right, bottom) tuples and are
+    referred to by their position in the sequence the index was built from.
+    """
+
+    def __init__(self, rects, capacity=16):
+        self.capacity = capacity
+        level = [
+            (left, top, right, bottom, index)
+            for index, (left, top, right, bottom) in enumerate(rects)
+        ]
+        self.size = len(level)
+        while len(level) > 1:
+            level = self._pack(level)
+        self.root = level[0] if level else None
+
+    def __len__(self):
+        return self.size
+
+    def _pack(self, entries):
+        """Group entries into nodes of at most capacity entries, tile by tile"""
+        capacity = self.capacity
+        node_count = math.ceil(len(entries) / capacity)
+        slab_size = math.ceil(math.sqrt(node_count)) * capacity
+        entries = sorted(entries, key=lambda entry: entry[0] + entry[2])
+        nodes = []
+        for start in range(0, len(entries), slab_size):
+            slab = sorted(
+                entries[start:start + slab_size],
+                key=lambda entry: entry[1] + entry[3],
+            )
+            for first in range(0, len(slab), capacity):
+                group = slab[first:first + capacity]
+                nodes.append((
+                    min([entry[0] for entry in group]),
+                    min([entry[1] for entry in group]),
+                    max([entry[2] for entry in group]),
+                    max([entry[3] for entry in group]),
+                    group,
+                ))
+        return nodes
+
+    def find(self, x, y):
+        """Return the index of a rectangle containing the point, None if there is none"""
+        if self.root is None:
+            return None
+        stack = [self.root]
+        while stack:
+            left, top, right, bottom, payload = stack.pop()
+            if left <= x <= right and top <= y <= bottom:
+                if payload.__class__ is int:
+                    return payload
+                stack.extend(payload)
+        return None
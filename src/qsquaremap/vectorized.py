@@ -0,0 +1,132 @@
+"""NumPy layout kernel computing the child rectangles of a node as arrays
+
+NumPy is optional, load_numpy() returns None when it is not installed.  It
+is only imported when first needed, importing the layout stays cheap.
+"""
+import bisect
+
+# the numpy module once looked for, False until then
+_numpy = False
+
+
+def load_numpy():
+    """Return the numpy module, None if it is not installed"""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def __getattr__(name):
+    # vectorized.numpy, as before NumPy was imported lazily
+    if name == 'numpy':
+        return load_numpy()
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+# runs of fewer children than this are computed in plain Python
+short_run = 32
+
+
+def slice_layout(values, x, y, width, height, padding=0, total=None):
+    """Lay out children values like LayoutEngine.LayoutChildren's strip slicing
+
+    The biggest child is split off the left (or top, for tall rectangles) of
+    the rectangle, the next one off the remaining tail and so on.  As long as
+    the split direction does not change the offsets of a run of children are
+    cumulative sums of their values, so each run is computed at once.
+
+    values -- 1-D array-like of the children values, in any order
+    x, y, width, height -- the rectangle to lay the children out in
+    padding -- stop once the remaining tail is no bigger than twice this
+    total -- the sum the values are fractions of, defaults to their sum
+
+    Returns (order, rects): the indices into values of the laid out children,
+    biggest first, and the matching float (len(order), 4) array of
+    (x, y, width, height) rectangles.
+    """
+    numpy = load_numpy()
+    values = numpy.asarray(values, dtype=float)
+    # stable descending order: equal values come out last one first, like
+    # taking the nodes from the end of the sorted list does
+    order = numpy.argsort(values, kind='stable')[::-1]
+    sizes = values[order]
+    count = len(sizes)
+    if total is None:
+        total = sizes.sum()
+    if not count or total <= 0:
+        return order[:0], numpy.empty((0, 4))
+    # remaining sum after (tail_sum) and before (head_sum) each child
+    tail_sum = total - numpy.cumsum(sizes)
+    head_sum = tail_sum + sizes
+    positive = int(numpy.count_nonzero(sizes > 0))
+    # the per-run scalars are read from lists: where the direction switches
+    # after every child, NumPy's per-call overhead would dominate
+    heads = head_sum.tolist()
+    tails = tail_sum.tolist()
+    # bisect needs ascending values
+    keys = (-tail_sum).tolist()
+    extents = sizes.tolist()
+    limit = 2 * padding
+    rows = []
+    first = 0
+    while first < min(count, positive):
+        head = heads[first]
+        if head <= 0:
+            break
+        horizontal = width >= height
+        length, across = (width, height) if horizontal else (height, width)
+        # length of the rectangle per unit of value for this run
+        scale = length / head
+        if horizontal:
+            # switch once the tail becomes narrower than high
+            switch = bisect.bisect_right(keys, -across / scale, first)
+        else:
+            # switch once the tail becomes no higher than wide
+            switch = bisect.bisect_left(keys, -across / scale, first)
+        if across > limit:
+            cut = bisect.bisect_left(keys, -limit / scale, first)
+        else:
+            cut = first
+        last = min(switch, cut, count - 1, positive - 1)
+        if last - first < short_run:
+            for index in range(first, last + 1):
+                offset = scale * (head - heads[index])
+                extent = scale * extents[index]
+                if horizontal:
+                    rows.append((x + offset, y, extent, height))
+                else:
+                    rows.append((x, y + offset, width, extent))
+        else:
+            run = slice(first, last + 1)
+            offsets = scale * (head - head_sum[run])
+            run_extents = scale * sizes[run]
+            run_rects = numpy.empty((last + 1 - first, 4))
+            if horizontal:
+                run_rects[:, 0] = x + offsets
+                run_rects[:, 1] = y
+                run_rects[:, 2] = run_extents
+                run_rects[:, 3] = height
+            else:
+                run_rects[:, 0] = x
+                run_rects[:, 1] = y + offsets
+                run_rects[:, 2] = width
+                run_rects[:, 3] = run_extents
+            rows.extend(run_rects.tolist())
+        if last != switch or last == cut:
+            break
+        # the tail after the run is laid out in the other direction
+        shift = scale * (head - tails[last])
+        if horizontal:
+            x += shift
+            width -= shift
+        else:
+            y += shift
+            height -= shift
+        first = last + 1
+    laid_out = len(rows)
+    return order[:laid_out], numpy.array(rows, dtype=float).reshape(laid_out, 4)
@@ -0,0 +1,265 @@
+"""LayoutEngine against the original recursive strip slicing
+
+These tests only use the Qt-free layout core.  Those marked slow, laying
+out 500k children, only run with ``pytest -m slow``.
+"""
+import operator
+import random
+import sys
+
+import pytest
+
+from qsquaremap import vectorized
+from qsquaremap.layout import (
+    LayoutEngine,
+    Node,
+    NodeAdapter,
+    box_key,
+    coord_bigger_than_padding,
+    split_box,
+    split_by_value,
+)
+
+
+class RecursiveEngine(LayoutEngine):
+    """LayoutChildren as it was, recursing once per child"""
+
+    def LayoutChildren(self, children, parent, rect, hot_map, depth=0, node_sum=None):
+        if node_sum is None:
+            nodes = [(self.adapter.value(node, parent), node) for node in children]
+            nodes.sort(key=operator.itemgetter(0))
+            total = self.adapter.children_sum(children, parent)
+        else:
+            nodes = children
+            total = node_sum
+        if not total:
+            return
+        padding = self.padding + self.margin
+        if self.square_style and len(nodes) > 5:
+            (head_sum, head), (tail_sum, tail) = split_by_value(total, nodes)
+            if head and tail:
+                head_coord, tail_coord = split_box(head_sum / float(total), rect)
+                if head_coord:
+                    self.LayoutChildren(head, parent, head_coord, hot_map, depth, head_sum)
+                if tail_coord and coord_bigger_than_padding(tail_coord, padding):
+                    self.LayoutChildren(tail, parent, tail_coord, hot_map, depth, tail_sum)
+                return
+        first_size, first_node = nodes[-1]
+        head_coord, tail_coord = split_box(first_size / float(total), rect)
+        if not head_coord:
+            return
+        self.LayoutNode(first_node, head_coord, hot_map, depth)
+        if len(nodes) > 1 and tail_coord and coord_bigger_than_padding(tail_coord, padding):
+            self.LayoutChildren(
+                nodes[:-1], parent, tail_coord, hot_map, depth, total - first_size
+            )
+
+
+class DuckAdapter:
+    """The original DefaultAdapter interface, without deriving from NodeAdapter"""
+
+    def children(self, node):
+        return node.children
+
+    def value(self, node, parent=None):
+        return node.value
+
+    def label(self, node):
+        return str(node.name)
+
+    def overall(self, node):
+        return sum([self.value(value, node) for value in self.children(node)])
+
+    def children_sum(self, children, node):
+        return sum([self.value(value, node) for value in children])
+
+    def empty(self, node):
+        overall = self.overall(node)
+        if overall:
+            return (overall - self.children_sum(self.children(node), node)) / float(overall)
+        return 0
+
+    def parents(self, node):
+        return []
+
+
+def build_tree(fanout, levels, rnd):
+    if not levels or rnd.random() < 0.3:
+        return Node('leaf', rnd.randint(0, 100), [])
+    children = [build_tree(fanout, levels - 1, rnd) for i in range(rnd.randint(1, fanout))]
+    return Node('node', sum([child.value for child in children]), children)
+
+
+def flatten(layout):
+    return [(box_key(box), box.depth, tuple(box.rect), box.labels) for box in layout.boxes()]
+
+
+@pytest.mark.parametrize('square_style', [False, True])
+@pytest.mark.parametrize('seed', range(10))
+def test_same_boxes_as_recursive(seed, square_style):
+    model = build_tree(12, 5, random.Random(seed))
+    options = dict(padding=2, margin=1, square_style=square_style)
+    rect = (0, 0, 800, 600)
+    expected = RecursiveEngine(NodeAdapter(), **options).layout(model, rect)
+    engine = LayoutEngine(NodeAdapter(), **options)
+    assert flatten(engine.layout(model, rect)) == flatten(expected)
+
+
+@pytest.mark.parametrize('options', [
+    {}, {'ordered': True}, {'squarified': True, 'min_area': 50}, {'vectorize_threshold': 2},
+])
+def test_duck_typed_adapter(options):
+    model = build_tree(12, 5, random.Random(0))
+    rect = (0, 0, 800, 600)
+    threshold = options.pop('vectorize_threshold', None)
+    expected = LayoutEngine(NodeAdapter(), **options)
+    engine = LayoutEngine(DuckAdapter(), **options)
+    expected.vectorize_threshold = engine.vectorize_threshold = threshold
+    if threshold and vectorized.load_numpy() is None:
+        pytest.skip('NumPy is not installed')
+    assert flatten(engine.layout(model, rect)) == flatten(expected.layout(model, rect))
+
+
+def test_fanout_same_boxes_as_recursive():
+    rnd = random.Random(0)
+    children = [Node('file', rnd.randint(1, 1000), []) for i in range(5000)]
+    model = Node('dir', sum([child.value for child in children]), children)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 20000))
+    try:
+        expected = RecursiveEngine(NodeAdapter(), padding=0, margin=0).layout(
+            model, (0, 0, 4000, 3000)
+        )
+    finally:
+        sys.setrecursionlimit(limit)
+    engine = LayoutEngine(NodeAdapter(), padding=0, margin=0)
+    assert flatten(engine.layout(model, (0, 0, 4000, 3000))) == flatten(expected)
+
+
+@pytest.fixture(scope='module')
+def wide_model():
+    rnd = random.Random(0)
+    children = [Node('file', rnd.randint(1, 1 << 20), ()) for i in range(500000)]
+    return Node('dir', sum([child.value for child in children]), children)
+
+
+@pytest.mark.slow
+def test_fanout_500k(wide_model):
+    engine = LayoutEngine(NodeAdapter())
+    layout = engine.layout(wide_model, (0, 0, 1920, 1080))
+    boxes = layout.hot_map[0].children
+    assert len(boxes) > 490000
+    assert layout.nodeAtPosition((960, 540)) is not None
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(vectorized.load_numpy() is None, reason='NumPy is not installed')
+def test_fanout_500k_vectorized(wide_model):
+    python = LayoutEngine(NodeAdapter())
+    expected = python.layout(wide_model, (0, 0, 1920, 1080)).hot_map[0].children
+    engine = LayoutEngine(NodeAdapter())
+    engine.vectorize_threshold = 256
+    boxes = engine.layout(wide_model, (0, 0, 1920, 1080)).hot_map[0].children
+    assert [box.node for box in boxes] == [box.node for box in expected]
+    for box, other in zip(boxes, expected):
+        assert box.rect == pytest.approx(other.rect, abs=1e-6)
+
+
+def branchy_tree(rnd):
+    """Return a random tree with a few children at the root at least"""
+    model = build_tree(8, 5, rnd)
+    while len(model.children) < 3:
+        model = build_tree(8, 5, rnd)
+    return model
+
+
+def leaf_path(model, rnd):
+    """Return a random leaf of the model and its ancestors, parent first"""
+    ancestors = []
+    node = model
+    while node.children:
+        ancestors.insert(0, node)
+        node = rnd.choice(node.children)
+    return node, ancestors
+
+
+def relayout(engine, layout, node, ancestors):
+    """Relayout the nearest laid out of the node and its ancestors, as QSquareMap does"""
+    for target in [node] + ancestors:
+        if layout.box(target) is not None:
+            return engine.relayout(layout, target)
+
+
+def within(rect, outer, tolerance=1e-6):
+    x, y, width, height = rect
+    outer_x, outer_y, outer_width, outer_height = outer
+    return (
+        x >= outer_x - tolerance
+        and y >= outer_y - tolerance
+        and x + width <= outer_x + outer_width + tolerance
+        and y + height <= outer_y + outer_height + tolerance
+    )
+
+
+@pytest.mark.parametrize('zoomed', [False, True])
+@pytest.mark.parametrize('seed', range(10))
+def test_relayout_value(seed, zoomed):
+    rnd = random.Random(seed)
+    model = branchy_tree(rnd)
+    if zoomed:
+        model = max(model.children, key=lambda child: len(child.children))
+    engine = LayoutEngine(NodeAdapter(), padding=2, margin=1)
+    layout = engine.layout(model, (0, 0, 800, 600))
+    for i in range(5):
+        node, ancestors = leaf_path(model, rnd)
+        delta = rnd.randint(1, 50)
+        for changed in [node] + ancestors:
+            changed.value += delta
+        relayout(engine, layout, node, ancestors)
+        assert flatten(layout) == flatten(engine.layout(model, (0, 0, 800, 600)))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_relayout_value_not_propagated(seed):
+    rnd = random.Random(seed)
+    model = branchy_tree(rnd)
+    engine = LayoutEngine(NodeAdapter(), padding=2, margin=1)
+    layout = engine.layout(model, (0, 0, 800, 600))
+    for attempt in range(100):
+        node, ancestors = leaf_path(model, rnd)
+        if ancestors and layout.box(node) is not None:
+            break
+    else:
+        pytest.skip('no leaf is laid out')
+    parent = layout.box(ancestors[0])
+    outside = [box for box in layout.boxes() if not within(box.rect, parent.rect)]
+    node.value += rnd.randint(1, 50)
+    dirty = relayout(engine, layout, node, ancestors)
+    assert flatten(layout) == flatten(engine.layout(model, (0, 0, 800, 600)))
+    assert within(dirty, parent.rect)
+    # the boxes outside of the parent are kept as they were
+    assert all([layout.box(box.node) is box for box in outside])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_relayout_children(seed):
+    rnd = random.Random(seed)
+    model = branchy_tree(rnd)
+    engine = LayoutEngine(NodeAdapter(), padding=2, margin=1)
+    layout = engine.layout(model, (0, 0, 800, 600))
+    for i in range(5):
+        node, ancestors = leaf_path(model, rnd)
+        if not ancestors:
+            break
+        parent, ancestors = ancestors[0], ancestors[1:]
+        children = parent.children[1:] + [
+            Node('new', rnd.randint(1, 100), []) for j in range(rnd.randint(0, 3))
+        ]
+        delta = sum([child.value for child in children]) - parent.value
+        parent.children = children
+        for changed in [parent] + ancestors:
+            changed.value += delta
+        relayout(engine, layout, parent, ancestors)
+        expected = engine.layout(model, (0, 0, 800, 600))
+        assert flatten(layout) == flatten(expected)
+        assert set(layout.boxes_by_node) == set(expected.boxes_by_node)